@@ -0,0 +1,42 @@
+"""add category_price_stats
+
+Revision ID: 3d7c81f05e6a
+Revises: 9e4f2a61c7b3
+Create Date: 2026-10-18 15:03:52.774190
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3d7c81f05e6a'
+down_revision: Union[str, None] = '9e4f2a61c7b3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('category_price_stats',
+    sa.Column('category_id', sa.Integer(), nullable=False),
+    sa.Column('good_count', sa.Integer(), nullable=False),
+    sa.Column('price_sum', sa.Float(), nullable=False),
+    sa.Column('min_price', sa.Float(), nullable=True),
+    sa.Column('max_price', sa.Float(), nullable=True),
+    sa.ForeignKeyConstraint(['category_id'], ['category.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('category_id')
+    )
+    op.execute(
+        "INSERT INTO category_price_stats "
+        "(category_id, good_count, price_sum, min_price, max_price) "
+        "SELECT category.id, count(good.id), coalesce(sum(good.unit_price), 0), "
+        "min(good.unit_price), max(good.unit_price) "
+        "FROM category LEFT OUTER JOIN good ON good.category_id = category.id "
+        "GROUP BY category.id"
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('category_price_stats')
@@ -0,0 +1,41 @@
+"""add good stock shards
+
+Revision ID: 5b0d7e2c91fa
+Revises: e91b3f4a0c58
+Create Date: 2026-10-18 21:14:52.604118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b0d7e2c91fa'
+down_revision: Union[str, None] = 'e91b3f4a0c58'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('good', sa.Column('stock_shards', sa.Integer(), server_default='0', nullable=False))
+    op.create_table('good_stock_shard',
+    sa.Column('good_id', sa.Integer(), nullable=False),
+    sa.Column('shard', sa.Integer(), nullable=False),
+    sa.Column('stock', sa.Integer(), nullable=False),
+    sa.CheckConstraint('stock >= 0', name='ck_good_stock_shard_stock'),
+    sa.ForeignKeyConstraint(['good_id'], ['good.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('good_id', 'shard')
+    )
+
+
+def downgrade() -> None:
+    # whatever the shards still hold goes back to the good rows
+    op.execute(
+        'UPDATE good SET stock = coalesce(good.stock, 0) + totals.total '
+        'FROM (SELECT good_id, sum(stock) AS total FROM good_stock_shard '
+        'GROUP BY good_id) AS totals WHERE good.id = totals.good_id'
+    )
+    op.drop_table('good_stock_shard')
+    op.drop_column('good', 'stock_shards')
@@ -0,0 +1,49 @@
+"""add access path indexes
+
+Revision ID: 5b1e0c7a9d24
+Revises: c217014ee24c
+Create Date: 2026-10-18 10:12:41.308517
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b1e0c7a9d24'
+down_revision: Union[str, None] = 'c217014ee24c'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+indexes = [
+    ('ix_good_seller_id_id', 'good', ['seller_id', 'id']),
+    ('ix_good_category_id_unit_price', 'good', ['category_id', 'unit_price', 'id']),
+    ('ix_good_unit_price_id', 'good', ['unit_price', 'id']),
+    ('ix_order_customer_id_id', 'order', ['customer_id', 'id']),
+    ('ix_order_detail_good_id', 'order_detail', ['good_id']),
+]
+
+
+def upgrade() -> None:
+    # CONCURRENTLY can not run inside a transaction block
+    with op.get_context().autocommit_block():
+        for name, table, columns in indexes:
+            op.create_index(
+                name, table, columns,
+                unique=False,
+                postgresql_concurrently=True,
+                if_not_exists=True
+            )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, _ in reversed(indexes):
+            op.drop_index(
+                name,
+                table_name=table,
+                postgresql_concurrently=True,
+                if_exists=True
+            )
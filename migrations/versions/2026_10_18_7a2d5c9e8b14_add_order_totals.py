@@ -0,0 +1,36 @@
+"""add order totals
+
+Revision ID: 7a2d5c9e8b14
+Revises: 3d7c81f05e6a
+Create Date: 2026-10-18 17:21:06.418532
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7a2d5c9e8b14'
+down_revision: Union[str, None] = '3d7c81f05e6a'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('order', sa.Column('total_amount', sa.Float(), server_default='0', nullable=False))
+    op.add_column('order', sa.Column('item_count', sa.Integer(), server_default='0', nullable=False))
+    op.execute(
+        'UPDATE "order" SET total_amount = totals.total_amount, '
+        'item_count = totals.item_count '
+        'FROM (SELECT order_id, sum(price) AS total_amount, '
+        'sum(quantity) AS item_count '
+        'FROM order_detail GROUP BY order_id) AS totals '
+        'WHERE "order".id = totals.order_id'
+    )
+
+
+def downgrade() -> None:
+    op.drop_column('order', 'item_count')
+    op.drop_column('order', 'total_amount')
@@ -0,0 +1,57 @@
+"""add product name search indexes
+
+Revision ID: 9e4f2a61c7b3
+Revises: 5b1e0c7a9d24
+Create Date: 2026-10-18 12:40:17.902114
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9e4f2a61c7b3'
+down_revision: Union[str, None] = '5b1e0c7a9d24'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_good_product_name_tsv', 'good',
+            [sa.text("to_tsvector('simple'::regconfig, product_name)")],
+            unique=False,
+            postgresql_using='gin',
+            postgresql_concurrently=True,
+            if_not_exists=True
+        )
+        op.create_index(
+            'ix_good_product_name_trgm', 'good',
+            ['product_name'],
+            unique=False,
+            postgresql_using='gin',
+            postgresql_ops={'product_name': 'gin_trgm_ops'},
+            postgresql_concurrently=True,
+            if_not_exists=True
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ix_good_product_name_trgm',
+            table_name='good',
+            postgresql_concurrently=True,
+            if_exists=True
+        )
+        op.drop_index(
+            'ix_good_product_name_tsv',
+            table_name='good',
+            postgresql_concurrently=True,
+            if_exists=True
+        )
@@ -0,0 +1,43 @@
+"""add sales daily
+
+Revision ID: a37f6c2e1d49
+Revises: 5b0d7e2c91fa
+Create Date: 2026-10-18 22:03:41.218530
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a37f6c2e1d49'
+down_revision: Union[str, None] = '5b0d7e2c91fa'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # existing orders start unrolled, tasks.sales counts them in batches
+    op.add_column('order', sa.Column('rolled_up', sa.Boolean(), server_default='false', nullable=False))
+    op.create_index('ix_order_id_not_rolled_up', 'order', ['id'], unique=False, postgresql_where=sa.text('NOT rolled_up'))
+    op.create_table('sales_daily',
+    sa.Column('seller_id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('good_id', sa.Integer(), nullable=False),
+    sa.Column('quantity', sa.Integer(), nullable=False),
+    sa.Column('revenue', sa.Float(), nullable=False),
+    sa.Column('orders', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['good_id'], ['good.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['seller_id'], ['user.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('seller_id', 'day', 'good_id')
+    )
+    op.create_index('ix_sales_daily_good_id_day', 'sales_daily', ['good_id', 'day'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_sales_daily_good_id_day', table_name='sales_daily')
+    op.drop_table('sales_daily')
+    op.drop_index('ix_order_id_not_rolled_up', table_name='order')
+    op.drop_column('order', 'rolled_up')
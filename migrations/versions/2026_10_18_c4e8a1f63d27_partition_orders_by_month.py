@@ -0,0 +1,148 @@
+"""partition orders by month
+
+Revision ID: c4e8a1f63d27
+Revises: 7a2d5c9e8b14
+Create Date: 2026-10-18 18:42:17.905311
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4e8a1f63d27'
+down_revision: Union[str, None] = '7a2d5c9e8b14'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# monthly partitions from the first order up to three months ahead;
+# later months are added by tasks.partitions
+CREATE_PARTITIONS = """
+DO $$
+DECLARE
+    month date;
+BEGIN
+    FOR month IN
+        SELECT generate_series(
+            date_trunc('month', coalesce((SELECT min(date_order) FROM order_old), now())),
+            date_trunc('month', now()) + interval '3 months',
+            interval '1 month'
+        )::date
+    LOOP
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF "order" FOR VALUES FROM (%L) TO (%L)',
+            'order_y' || to_char(month, 'YYYY') || 'm' || to_char(month, 'MM'),
+            month, month + interval '1 month'
+        );
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF order_detail FOR VALUES FROM (%L) TO (%L)',
+            'order_detail_y' || to_char(month, 'YYYY') || 'm' || to_char(month, 'MM'),
+            month, month + interval '1 month'
+        );
+    END LOOP;
+END $$
+"""
+
+
+def upgrade() -> None:
+    op.rename_table('order_detail', 'order_detail_old')
+    op.rename_table('order', 'order_old')
+    op.execute('ALTER TABLE order_old RENAME CONSTRAINT order_pkey TO order_old_pkey')
+    op.execute('ALTER TABLE order_detail_old RENAME CONSTRAINT order_detail_pkey TO order_detail_old_pkey')
+    op.drop_index('ix_order_customer_id_id', table_name='order_old')
+    op.drop_index('ix_order_detail_good_id', table_name='order_detail_old')
+
+    op.create_table('order',
+    sa.Column('id', sa.Integer(), server_default=sa.text("nextval('order_id_seq')"), nullable=False),
+    sa.Column('customer_id', sa.Integer(), nullable=False),
+    sa.Column('date_order', sa.TIMESTAMP(timezone=True), nullable=False),
+    sa.Column('ship_country', sa.String(), nullable=False),
+    sa.Column('total_amount', sa.Float(), server_default='0', nullable=False),
+    sa.Column('item_count', sa.Integer(), server_default='0', nullable=False),
+    sa.ForeignKeyConstraint(['customer_id'], ['user.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id', 'date_order'),
+    postgresql_partition_by='RANGE (date_order)'
+    )
+    op.execute('ALTER SEQUENCE order_id_seq OWNED BY "order".id')
+    op.create_table('order_detail',
+    sa.Column('order_id', sa.Integer(), nullable=False),
+    sa.Column('good_id', sa.Integer(), nullable=False),
+    sa.Column('date_order', sa.TIMESTAMP(timezone=True), nullable=False),
+    sa.Column('quantity', sa.Integer(), nullable=False),
+    sa.Column('price', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['good_id'], ['good.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['order_id', 'date_order'], ['order.id', 'order.date_order'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('order_id', 'good_id', 'date_order'),
+    postgresql_partition_by='RANGE (date_order)'
+    )
+    op.create_index('ix_order_customer_id_id', 'order', ['customer_id', 'id'], unique=False)
+    op.create_index('ix_order_detail_good_id', 'order_detail', ['good_id'], unique=False)
+
+    op.execute('CREATE TABLE order_default PARTITION OF "order" DEFAULT')
+    op.execute('CREATE TABLE order_detail_default PARTITION OF order_detail DEFAULT')
+    op.execute(CREATE_PARTITIONS)
+
+    op.execute(
+        'INSERT INTO "order" '
+        '(id, customer_id, date_order, ship_country, total_amount, item_count) '
+        'SELECT id, customer_id, date_order, ship_country, total_amount, item_count '
+        'FROM order_old'
+    )
+    op.execute(
+        'INSERT INTO order_detail '
+        '(order_id, good_id, date_order, quantity, price) '
+        'SELECT order_detail_old.order_id, order_detail_old.good_id, '
+        'order_old.date_order, order_detail_old.quantity, order_detail_old.price '
+        'FROM order_detail_old JOIN order_old ON order_old.id = order_detail_old.order_id'
+    )
+    op.drop_table('order_detail_old')
+    op.drop_table('order_old')
+
+
+def downgrade() -> None:
+    op.rename_table('order_detail', 'order_detail_part')
+    op.rename_table('order', 'order_part')
+    op.drop_index('ix_order_customer_id_id', table_name='order_part')
+    op.drop_index('ix_order_detail_good_id', table_name='order_detail_part')
+    op.execute('ALTER TABLE order_part RENAME CONSTRAINT order_pkey TO order_part_pkey')
+    op.execute('ALTER TABLE order_detail_part RENAME CONSTRAINT order_detail_pkey TO order_detail_part_pkey')
+
+    op.create_table('order',
+    sa.Column('id', sa.Integer(), server_default=sa.text("nextval('order_id_seq')"), nullable=False),
+    sa.Column('customer_id', sa.Integer(), nullable=False),
+    sa.Column('date_order', sa.TIMESTAMP(timezone=True), nullable=False),
+    sa.Column('ship_country', sa.String(), nullable=False),
+    sa.Column('total_amount', sa.Float(), server_default='0', nullable=False),
+    sa.Column('item_count', sa.Integer(), server_default='0', nullable=False),
+    sa.ForeignKeyConstraint(['customer_id'], ['user.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.execute('ALTER SEQUENCE order_id_seq OWNED BY "order".id')
+    op.create_table('order_detail',
+    sa.Column('order_id', sa.Integer(), nullable=False),
+    sa.Column('good_id', sa.Integer(), nullable=False),
+    sa.Column('quantity', sa.Integer(), nullable=False),
+    sa.Column('price', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['good_id'], ['good.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['order_id'], ['order.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('order_id', 'good_id')
+    )
+
+    op.execute(
+        'INSERT INTO "order" '
+        '(id, customer_id, date_order, ship_country, total_amount, item_count) '
+        'SELECT id, customer_id, date_order, ship_country, total_amount, item_count '
+        'FROM order_part'
+    )
+    op.execute(
+        'INSERT INTO order_detail (order_id, good_id, quantity, price) '
+        'SELECT order_id, good_id, quantity, price FROM order_detail_part'
+    )
+    op.drop_table('order_detail_part')
+    op.drop_table('order_part')
+
+    op.create_index('ix_order_customer_id_id', 'order', ['customer_id', 'id'], unique=False)
+    op.create_index('ix_order_detail_good_id', 'order_detail', ['good_id'], unique=False)
@@ -0,0 +1,28 @@
+"""add good stock
+
+Revision ID: e91b3f4a0c58
+Revises: c4e8a1f63d27
+Create Date: 2026-10-18 20:05:33.170264
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e91b3f4a0c58'
+down_revision: Union[str, None] = 'c4e8a1f63d27'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('good', sa.Column('stock', sa.Integer(), nullable=True))
+    op.create_check_constraint('ck_good_stock', 'good', 'stock >= 0')
+
+
+def downgrade() -> None:
+    op.drop_constraint('ck_good_stock', 'good', type_='check')
+    op.drop_column('good', 'stock')
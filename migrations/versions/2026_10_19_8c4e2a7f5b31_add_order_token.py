@@ -0,0 +1,31 @@
+"""add order token
+
+Revision ID: 8c4e2a7f5b31
+Revises: d2f9a4b7c610
+Create Date: 2026-10-19 10:27:45.093612
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8c4e2a7f5b31'
+down_revision: Union[str, None] = 'd2f9a4b7c610'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('order_token',
+    sa.Column('token', sa.String(), nullable=False),
+    sa.Column('order_id', sa.Integer(), nullable=True),
+    sa.Column('created', sa.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('token')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('order_token')
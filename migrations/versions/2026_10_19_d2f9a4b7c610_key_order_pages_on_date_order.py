@@ -0,0 +1,27 @@
+"""key order pages on date_order
+
+Revision ID: d2f9a4b7c610
+Revises: a37f6c2e1d49
+Create Date: 2026-10-19 09:12:08.441937
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd2f9a4b7c610'
+down_revision: Union[str, None] = 'a37f6c2e1d49'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_order_customer_id_date_order_id', 'order', ['customer_id', 'date_order', 'id'], unique=False)
+    op.drop_index('ix_order_customer_id_id', table_name='order')
+
+
+def downgrade() -> None:
+    op.create_index('ix_order_customer_id_id', 'order', ['customer_id', 'id'], unique=False)
+    op.drop_index('ix_order_customer_id_date_order_id', table_name='order')
@@ -11,6 +11,7 @@ from auth.utils import get_user_db
 from tasks.email_msg import after_reg, after_reset, \
                             reset_pass, verify_account, after_verify
 from config import setting
+from cache import bump, user_version
 
 
 class UserManager(IntegerIDMixin, BaseUserManager[User, int]):
@@ -232,6 +233,7 @@ class UserManager(IntegerIDMixin, BaseUserManager[User, int]):
         user: User, 
         request: Optional[Request] = None
     ) -> None:
+        await bump(user_version(user.id))
         after_verify(user.email, user.username)
 
 
@@ -1,5 +1,5 @@
 from typing import Optional, Union
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from fastapi_users.exceptions import UserAlreadyExists, UserNotExists
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import delete, select, update
@@ -10,6 +10,10 @@ from auth.base_config import fastapi_users
 from auth.manager import UserManager
 from auth.models import User
 from database import get_async_session
+from cache import bump, bump_versions, get_validator, not_modified, \
+                  user_version
+from management.stats import refresh_stats
+from management.snapshot import notify_catalog
 from tasks.email_msg import after_delete
 
 
@@ -59,9 +63,15 @@ async def custom_registration(
 @router_user.get("/users/{user_id}", response_model=Optional[UserInfo])
 async def get_user_by_id(
     user_id: int,
+    request: Request,
+    response: Response,
     user_manager: UserManager = Depends(fastapi_users.get_user_manager)
-) -> Union[UserInfo, Exception]:
+) -> Union[UserInfo, Response, Exception]:
     
+    validator = await get_validator(user_version(user_id), {})
+    if validator and not_modified(request, validator):
+        return Response(status_code=304, headers=validator.headers)
+
     try:
         user = await user_manager.get(user_id)
     except UserNotExists:
@@ -70,6 +80,8 @@ async def get_user_by_id(
             detail="User not found"
         )
     
+    if validator:
+        response.headers.update(validator.headers)
     return user
 
 @router_user.get("/about_me", response_model=MyInfo)
@@ -163,6 +175,7 @@ async def deactivate_user(
         
         await session.execute(stmt)
         await session.commit()
+        await bump(user_version(id))
         return f"User with id = {id} was deactivate"
     except Exception as e:
         raise HTTPException(
@@ -216,6 +229,7 @@ async def activate_user(
         
         await session.execute(stmt)
         await session.commit()
+        await bump(user_version(id))
         return f"User with id = {id} was activate"
     except Exception as e:
         raise HTTPException(
@@ -248,6 +262,7 @@ async def admin_user(
         
         await session.execute(stmt)
         await session.commit()
+        await bump(user_version(user_id))
         return f"User with id = {user_id} is admin"
     except Exception as e:
         raise HTTPException(
@@ -298,7 +313,12 @@ async def delete_user(
             )
         
         await session.execute(stmt)
+        # goods of the user are removed by cascade
+        await refresh_stats(session)
+        await notify_catalog(session)
         await session.commit()
+        await bump_versions(id)
+        await bump(user_version(id))
         after_delete(res.email, res.username)
         return f"User with id = {id} was deleted"
     except Exception as e:
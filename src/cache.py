@@ -0,0 +1,213 @@
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Any, Awaitable, Callable, NamedTuple, Optional
+
+from fastapi import Request, Response
+from pydantic import BaseModel
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from config import setting
+
+
+logger = logging.getLogger(__name__)
+
+redis = Redis(host=setting.REDIS_HOST, port=6379)
+
+CATALOG_VERSION = 'catalog:version'
+
+IDEMPOTENCY_PENDING = b'pending'
+IDEMPOTENCY_LOCK_TTL = 30
+IDEMPOTENCY_POLL = 0.05
+
+
+class Validator(NamedTuple):
+    version: int
+    modified: int
+    digest: str
+
+    @property
+    def etag(self) -> str:
+        return f'W/"{self.version}-{self.digest[:16]}"'
+
+    @property
+    def headers(self) -> dict[str, str]:
+        return {
+            'ETag': self.etag,
+            'Last-Modified': formatdate(self.modified, usegmt=True)
+        }
+
+
+def seller_version(seller_id: int) -> str:
+    return f'seller:{seller_id}:version'
+
+def user_version(user_id: int) -> str:
+    return f'user:{user_id}:version'
+
+async def bump(*keys: str) -> None:
+    try:
+        async with redis.pipeline(transaction=False) as pipe:
+            now = int(time.time())
+            for key in set(keys):
+                pipe.incr(key)
+                pipe.set(f'{key}:modified', now)
+            await pipe.execute()
+    except RedisError as error:
+        # entries still expire after CACHE_TTL
+        logger.warning(f"Cache invalidation failed: {error}")
+
+async def bump_versions(*seller_ids: int) -> None:
+    await bump(
+        CATALOG_VERSION,
+        *[seller_version(seller_id) for seller_id in seller_ids]
+    )
+
+async def get_validator(version_key: str, params: dict) -> Optional[Validator]:
+    try:
+        async with redis.pipeline(transaction=False) as pipe:
+            # a counter that was never bumped starts its clock now
+            pipe.set(f'{version_key}:modified', int(time.time()), nx=True)
+            pipe.get(version_key)
+            pipe.get(f'{version_key}:modified')
+            _, version, modified = await pipe.execute()
+    except RedisError as error:
+        logger.warning(f"Cache is unavailable: {error}")
+        return None
+
+    normalized = json.dumps(
+        {
+            key: getattr(value, 'value', value)
+            for key, value in params.items() if value is not None
+        } | {'__version__': version_key},
+        sort_keys=True
+    )
+    return Validator(
+        version=int(version or 0),
+        modified=int(modified),
+        digest=hashlib.sha1(normalized.encode()).hexdigest()
+    )
+
+def not_modified(request: Request, validator: Validator) -> bool:
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match is not None:
+        tags = [item.strip().removeprefix('W/') for item in if_none_match.split(',')]
+        return '*' in tags or validator.etag.removeprefix('W/') in tags
+
+    if_modified_since = request.headers.get('if-modified-since')
+    if if_modified_since is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return validator.modified <= since
+
+    return False
+
+def dump(result: Any) -> bytes:
+    if isinstance(result, BaseModel):
+        return result.model_dump_json().encode()
+    return json.dumps(result).encode()
+
+async def read_through(
+    key: Optional[str],
+    build: Callable[[], Awaitable[Any]],
+    headers: Optional[dict] = None
+) -> Response:
+
+    payload = None
+    if key is not None:
+        try:
+            payload = await redis.get(key)
+        except RedisError as error:
+            logger.warning(f"Cache is unavailable: {error}")
+            key = None
+
+    if payload is None:
+        payload = dump(await build())
+        if key is not None:
+            try:
+                await redis.set(key, payload, ex=setting.CACHE_TTL)
+            except RedisError as error:
+                logger.warning(f"Cache write failed: {error}")
+
+    return Response(
+        content=payload,
+        media_type='application/json',
+        headers=headers
+    )
+
+async def cached_read(
+    request: Request,
+    scope: str,
+    version_key: str,
+    params: dict,
+    build: Callable[[], Awaitable[Any]]
+) -> Response:
+
+    # answered from the version counters before any query runs
+    validator = await get_validator(version_key, params)
+    if validator is None:
+        return await read_through(None, build)
+    if not_modified(request, validator):
+        return Response(status_code=304, headers=validator.headers)
+
+    return await read_through(
+        f'{scope}:v{validator.version}:{validator.digest}',
+        build,
+        validator.headers
+    )
+
+async def run_once(
+    key: str,
+    run: Callable[[], Awaitable[Any]]
+) -> tuple[Any, bool]:
+
+    # SET NX GET claims the key and reads a finished result in one command;
+    # a duplicate that arrives mid-flight waits for the first request
+    key = f'idempotency:{key}'
+    try:
+        while True:
+            payload = await redis.set(
+                key, IDEMPOTENCY_PENDING, nx=True, get=True, ex=IDEMPOTENCY_LOCK_TTL
+            )
+            if payload is None:
+                break
+            if payload != IDEMPOTENCY_PENDING:
+                return json.loads(payload), True
+            await asyncio.sleep(IDEMPOTENCY_POLL)
+    except RedisError as error:
+        logger.warning(f"Idempotency store is unavailable: {error}")
+        return await run(), False
+
+    async def renew() -> None:
+        # the claim outlives a slow run, however long it waits
+        while True:
+            await asyncio.sleep(IDEMPOTENCY_LOCK_TTL / 3)
+            try:
+                await redis.expire(key, IDEMPOTENCY_LOCK_TTL)
+            except RedisError as error:
+                logger.warning(f"Idempotency key renewal failed: {error}")
+
+    # run must not have committed anything when it raises, the key is
+    # freed for a retry
+    renewer = asyncio.create_task(renew())
+    try:
+        result = await run()
+    except BaseException:
+        try:
+            await redis.delete(key)
+        except RedisError as error:
+            logger.warning(f"Idempotency key release failed: {error}")
+        raise
+    finally:
+        renewer.cancel()
+
+    try:
+        await redis.set(key, dump(result), ex=setting.IDEMPOTENCY_TTL)
+    except RedisError as error:
+        logger.warning(f"Idempotency store write failed: {error}")
+    return result, False
@@ -16,9 +16,35 @@ class Setting(BaseSettings):
     
     SMTP_USER: str
     SMTP_PASS: str
+    SMTP_POOL_SIZE: int = 2
+    SMTP_POOL_MAX_MESSAGES: int = 100
 
     REDIS_HOST: str
 
+    CACHE_TTL: int = 300
+    IDEMPOTENCY_TTL: int = 3600
+
+    CATALOG_SNAPSHOT: bool = False
+    CATALOG_SNAPSHOT_PATH: str = '/dev/shm/catalog.snapshot'
+
+    ORDER_WRITER: bool = False
+    ORDER_WRITER_WINDOW: float = 0.005
+    ORDER_WRITER_BATCH: int = 500
+    ORDER_WRITER_TIMEOUT: float = 30
+
+    ORDER_INTAKE: bool = False
+    ORDER_INTAKE_STREAM: str = 'orders:intake'
+    ORDER_INTAKE_GROUP: str = 'order-writers'
+    ORDER_INTAKE_BATCH: int = 500
+    ORDER_INTAKE_CLAIM_MS: int = 60000
+    ORDER_STATUS_TTL: int = 86400
+
+    ORDER_PARTITIONS_AHEAD: int = 3
+    ORDER_RETAIN_MONTHS: int = 24
+
+    SALES_ROLLUP_BATCH: int = 5000
+    SALES_RANGE_DAYS: int = 30
+
     @property
     def DB_URL(self):
         return (
@@ -26,6 +52,13 @@ class Setting(BaseSettings):
             f"{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
         )
 
+    @property
+    def DB_URL_SYNC(self):
+        return (
+            f"postgresql+psycopg2://{self.DB_USER}:{self.DB_PASS}@"\
+            f"{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
+        )
+
     model_config = SettingsConfigDict(
         env_file=Path(__file__).resolve().parent.parent / ".env"
     )
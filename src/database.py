@@ -1,5 +1,6 @@
 from typing import AsyncGenerator
 
+from sqlalchemy import create_engine
 from sqlalchemy.orm import DeclarativeBase
 from sqlalchemy.ext.asyncio import create_async_engine, \
                                     async_sessionmaker, \
@@ -18,6 +19,13 @@ a_engine = create_async_engine(
 
 a_session = async_sessionmaker(a_engine)
 
+# for celery tasks, which run outside an event loop
+s_engine = create_engine(
+    url=setting.DB_URL_SYNC,
+    pool_size=2,
+    max_overflow=2
+)
+
 
 class Base(DeclarativeBase):
     pass
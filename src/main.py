@@ -1,13 +1,34 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 
 from auth.base_config import fastapi_users, auth_backend
 from auth.router import router_reg, router_user, \
                         router_admin, router_option
 from management.router import router_order, router_good
+from management.registry import registry
+from management.snapshot import catalog_snapshot
+from management.order_writer import order_writer
+from database import a_session
+from config import setting
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    async with a_session() as session:
+        await registry.load(session)
+    if setting.CATALOG_SNAPSHOT:
+        catalog_snapshot.start()
+    if setting.ORDER_WRITER:
+        order_writer.start()
+    yield
+    await order_writer.stop()
+    await catalog_snapshot.stop()
 
 
 app = FastAPI(
-    title="E-commerce prog"
+    title="E-commerce prog",
+    lifespan=lifespan
 )
 
 # authentication router
@@ -31,4 +52,4 @@ app.include_router(router_admin)
 app.include_router(router_good)
 
 # orders router
-app.include_router(router_order)
\ No newline at end of file
+app.include_router(router_order)
@@ -0,0 +1,131 @@
+import csv
+import json
+from typing import AsyncIterator, Optional
+
+from pydantic import ValidationError
+from sqlalchemy import column, insert, literal, select, table, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from management.models import Good
+from management.schemas import AddGood
+from management.registry import registry
+
+
+CHUNK_SIZE = 5000
+MAX_ERRORS = 1000
+MAX_RECORD_LINES = 100
+MAX_RECORD_SIZE = 65536
+
+GOOD_FIELDS = ['good_name', 'good_category', 'good_price']
+
+good_import = table(
+    'good_import',
+    column('product_name'),
+    column('category_id'),
+    column('unit_price')
+)
+
+
+async def read_lines(stream: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    tail = b''
+    async for chunk in stream:
+        tail += chunk
+        *lines, tail = tail.split(b'\n')
+        for line in lines:
+            yield line.decode('utf-8-sig', errors='replace').rstrip('\r')
+    if tail:
+        yield tail.decode('utf-8-sig', errors='replace').rstrip('\r')
+
+async def read_csv(lines: AsyncIterator[str]) -> AsyncIterator[Optional[dict]]:
+    header = None
+    record, quotes, spanned = None, 0, 0
+    async for line in lines:
+        # quoted fields may span several physical lines, but a stray quote
+        # must not swallow the rest of the file
+        record = line if record is None else f"{record}\n{line}"
+        quotes += line.count('"')
+        spanned += 1
+        if quotes % 2:
+            if spanned < MAX_RECORD_LINES and len(record) < MAX_RECORD_SIZE:
+                continue
+            record, quotes, spanned = None, 0, 0
+            yield {'__error__': f"Quoted field is not closed within "
+                                f"{MAX_RECORD_LINES} lines or {MAX_RECORD_SIZE} characters"}
+            continue
+        values = next(csv.reader([record]))
+        record, quotes, spanned = None, 0, 0
+        if header is None:
+            header = values
+            continue
+        yield dict(zip(header, values)) if values else None
+    if record is not None:
+        yield {'__error__': f"Quoted field is not closed at the end of the file"}
+
+async def read_ndjson(lines: AsyncIterator[str]) -> AsyncIterator[Optional[dict]]:
+    async for line in lines:
+        if not line.strip():
+            yield None
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as error:
+            yield {'__error__': f"Invalid JSON: {error}"}
+
+async def parse_good(
+    row: dict,
+    session: AsyncSession
+) -> tuple[Optional[tuple], Optional[str]]:
+
+    if not isinstance(row, dict):
+        return None, f"Row must be an object"
+    if '__error__' in row:
+        return None, row['__error__']
+
+    try:
+        good = AddGood.model_validate(
+            {field: row.get(field) for field in GOOD_FIELDS}
+        )
+    except ValidationError as error:
+        return None, "; ".join(
+            f"{'.'.join(map(str, item['loc']))}: {item['msg']}"
+            for item in error.errors()
+        )
+
+    cat_id = await registry.get_id(good.good_category, session)
+    if cat_id is None:
+        return None, f"Category {good.good_category.value} is not exists"
+    return (good.good_name, cat_id, good.good_price), None
+
+async def create_staging(session: AsyncSession) -> None:
+    await session.execute(text(
+        "CREATE TEMP TABLE good_import ("
+        "product_name varchar NOT NULL, "
+        "category_id integer NOT NULL, "
+        "unit_price double precision NOT NULL"
+        ") ON COMMIT DROP"
+    ))
+
+async def copy_chunk(session: AsyncSession, records: list[tuple]) -> None:
+    conn = await session.connection()
+    raw = await conn.get_raw_connection()
+    await raw.driver_connection.copy_records_to_table(
+        'good_import',
+        records=records,
+        columns=['product_name', 'category_id', 'unit_price']
+    )
+
+async def merge_staging(session: AsyncSession, seller_id: int) -> int:
+    stmt = \
+        insert(
+            Good
+        ).from_select(
+            ['product_name', 'seller_id', 'category_id', 'unit_price'],
+            select(
+                good_import.c.product_name,
+                literal(seller_id),
+                good_import.c.category_id,
+                good_import.c.unit_price
+            )
+        )
+
+    return (await session.execute(stmt)).rowcount
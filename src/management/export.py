@@ -0,0 +1,69 @@
+import csv
+import enum
+import io
+import json
+from typing import AsyncIterator
+
+from sqlalchemy import Select
+
+from management.registry import registry
+from database import a_session
+
+
+EXPORT_PARTITION = 1000
+
+EXPORT_FIELDS = [
+    'id', 'seller_id', 'seller_name', 'good_name', 'good_category', 'good_price'
+]
+
+
+class ExportFormat(str, enum.Enum):
+    ndjson = 'ndjson'
+    csv = 'csv'
+
+
+def media_type(export_format: ExportFormat) -> str:
+    if export_format == ExportFormat.csv:
+        return 'text/csv'
+    return 'application/x-ndjson'
+
+async def stream_goods(
+    query: Select,
+    export_format: ExportFormat
+) -> AsyncIterator[str]:
+
+    if export_format == ExportFormat.csv:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(EXPORT_FIELDS)
+        yield buffer.getvalue()
+
+    # the response outlives request dependencies, so the stream keeps its
+    # own session; the server-side cursor keeps memory flat
+    async with a_session() as session:
+        names = await registry.get_names(session)
+        result = await session.stream(
+            query.execution_options(yield_per=EXPORT_PARTITION)
+        )
+        async for partition in result.partitions():
+            rows = [
+                (
+                    item.id,
+                    item.seller_id,
+                    item.username,
+                    item.product_name,
+                    names[item.category_id].value,
+                    item.unit_price
+                )
+                for item in partition
+            ]
+
+            if export_format == ExportFormat.csv:
+                buffer = io.StringIO()
+                csv.writer(buffer).writerows(rows)
+                yield buffer.getvalue()
+            else:
+                yield "".join(
+                    json.dumps(dict(zip(EXPORT_FIELDS, row)), ensure_ascii=False) + "\n"
+                    for row in rows
+                )
@@ -0,0 +1,87 @@
+from typing import Optional
+
+from sqlalchemy import JSON, ColumnElement, func, select, tuple_
+
+from management.models import CategoryType, Good
+from management.schemas import CategoryFacet, Facets, PriceBucket
+
+
+FACET_BUCKET_WIDTH = 10.0
+FACET_MAX_BUCKETS = 100
+
+
+def facet_column(filters: list, bucket_width: float) -> ColumnElement:
+    # one uncorrelated sub-select, evaluated once next to the page rows;
+    # buckets past FACET_MAX_BUCKETS from the cheapest one fold into the last
+    raw = func.floor(Good.unit_price / bucket_width)
+    matched = \
+        select(
+            Good.category_id,
+            raw.label('raw'),
+            func.least(
+                raw, func.min(raw).over() + FACET_MAX_BUCKETS - 1
+            ).label('bucket')
+        ).filter(
+            *filters
+        ).correlate(
+            None
+        ).subquery('matched')
+
+    grouped = \
+        select(
+            func.grouping(matched.c.category_id).label('by_price'),
+            matched.c.category_id,
+            matched.c.bucket,
+            func.count().label('good_count'),
+            func.max(matched.c.raw).label('top')
+        ).group_by(
+            func.grouping_sets(
+                tuple_(matched.c.category_id),
+                tuple_(matched.c.bucket)
+            )
+        ).subquery('grouped')
+
+    return \
+        select(
+            func.json_agg(
+                func.json_build_array(
+                    grouped.c.by_price,
+                    grouped.c.category_id,
+                    grouped.c.bucket,
+                    grouped.c.good_count,
+                    grouped.c.top
+                ),
+                type_=JSON
+            )
+        ).scalar_subquery().label('facets')
+
+def parse_facets(
+    raw: Optional[list],
+    names: dict[int, CategoryType],
+    bucket_width: float
+) -> Facets:
+
+    categories = []
+    prices = []
+    for by_price, category_id, bucket, good_count, top in raw or []:
+        if by_price:
+            # the folded last bucket has no upper bound
+            prices.append(
+                PriceBucket(
+                    min_price=bucket * bucket_width,
+                    max_price=(bucket + 1) * bucket_width if top == bucket else None,
+                    good_count=good_count
+                )
+            )
+        else:
+            categories.append(
+                CategoryFacet(
+                    category=names[category_id],
+                    good_count=good_count
+                )
+            )
+
+    return Facets(
+        categories=sorted(categories, key=lambda item: -item.good_count),
+        prices=sorted(prices, key=lambda item: item.min_price)
+    )
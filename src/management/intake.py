@@ -0,0 +1,294 @@
+import asyncio
+import json
+import logging
+import uuid
+from datetime import timedelta
+from typing import Optional
+
+from redis.exceptions import RedisError, ResponseError
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import DataError, DBAPIError, IntegrityError
+
+from management.models import Good, OrderDetail, OrderToken
+from management.orders import OrderRequest, place_orders
+from management.stock import OutOfStock
+from tasks.email_msg import customer_order, seller_order
+from auth.models import User
+from database import a_session
+from cache import redis
+from config import setting
+
+
+logger = logging.getLogger(__name__)
+
+PENDING = 'pending'
+PLACED = 'placed'
+FAILED = 'failed'
+
+TOKEN_PURGE_INTERVAL = 3600
+
+
+def status_key(token: str) -> str:
+    return f'order:status:{token}'
+
+def error_code(error: Exception) -> int:
+    # the codes add_orders answers with when it places the order itself
+    if isinstance(error, OutOfStock):
+        return 409
+    if isinstance(error, ValueError):
+        return 488
+    if isinstance(error, LookupError):
+        return 489
+    return 500
+
+def decode_entry(fields: Optional[dict]) -> Optional[dict]:
+    # a poison entry is dropped instead of failing every batch it is in
+    try:
+        order = json.loads(fields[b'order'])
+        return {
+            'token': str(order['token']),
+            'email': str(order['email']),
+            'customer_id': int(order['customer_id']),
+            'country': str(order['country']),
+            'products': [int(item) for item in order['products']],
+            'counts': [int(item) for item in order['counts']]
+        }
+    except (KeyError, TypeError, ValueError):
+        return None
+
+async def enqueue_order(request: OrderRequest, email: str) -> str:
+    token = uuid.uuid4().hex
+    entry = json.dumps({
+        'token': token,
+        'email': email,
+        'customer_id': request.customer_id,
+        'country': request.country,
+        'products': request.products,
+        'counts': request.counts
+    })
+
+    # the status exists before any worker can read the entry
+    async with redis.pipeline(transaction=True) as pipe:
+        pipe.set(
+            status_key(token),
+            json.dumps({'status': PENDING, 'customer_id': request.customer_id}),
+            ex=setting.ORDER_STATUS_TTL
+        )
+        pipe.xadd(setting.ORDER_INTAKE_STREAM, {'order': entry})
+        await pipe.execute()
+    return token
+
+async def order_status(token: str) -> Optional[dict]:
+    payload = await redis.get(status_key(token))
+    return json.loads(payload) if payload is not None else None
+
+
+class OrderIntake:
+
+    def __init__(self, stream: str, group: str, max_batch: int) -> None:
+        self.stream = stream
+        self.group = group
+        self.max_batch = max_batch
+
+    async def setup(self) -> None:
+        try:
+            await redis.xgroup_create(self.stream, self.group, id='0', mkstream=True)
+        except ResponseError as error:
+            if 'BUSYGROUP' not in str(error):
+                raise
+
+    async def poll(self, consumer: str, block: int = 1000) -> int:
+        # entries a dead consumer read but never acknowledged come first
+        _, entries, *_ = await redis.xautoclaim(
+            self.stream, self.group, consumer,
+            min_idle_time=setting.ORDER_INTAKE_CLAIM_MS,
+            count=self.max_batch
+        )
+        if not entries:
+            response = await redis.xreadgroup(
+                self.group, consumer, {self.stream: '>'},
+                count=self.max_batch, block=block
+            )
+            entries = response[0][1] if response else []
+        if entries:
+            await self._persist(entries)
+        return len(entries)
+
+    async def run(self, consumer: str) -> None:
+        await self.setup()
+        loop = asyncio.get_running_loop()
+        purged = loop.time()
+        while True:
+            try:
+                await self.poll(consumer)
+                if loop.time() - purged > TOKEN_PURGE_INTERVAL:
+                    await self.purge_tokens()
+                    purged = loop.time()
+            except (RedisError, OSError, DBAPIError) as error:
+                # unacknowledged entries are claimed again later
+                logger.warning(f"Order intake poll failed: {error}")
+                await asyncio.sleep(1)
+
+    async def purge_tokens(self) -> None:
+        # a token only has to outlive the redelivery of its entry
+        async with a_session() as session:
+            stmt = \
+                delete(
+                    OrderToken
+                ).filter(
+                    OrderToken.created < func.now() - timedelta(seconds=setting.ORDER_STATUS_TTL)
+                )
+            await session.execute(stmt)
+            await session.commit()
+
+    async def _persist(self, entries: list) -> None:
+        orders = {}
+        for entry_id, fields in entries:
+            order = decode_entry(fields)
+            if order is None:
+                logger.error(f"Dropping malformed order intake entry {entry_id}")
+            else:
+                orders.setdefault(order['token'], order)
+        orders = list(orders.values())
+
+        statuses, items = {}, {}
+        if orders:
+            try:
+                await self._place(orders, statuses, items)
+            except (IntegrityError, DataError) as error:
+                # a bad order must not hold back the rest of the batch
+                logger.warning(f"Order intake batch failed, retrying one by one: {error}")
+                statuses.clear()
+                items.clear()
+                for order in orders:
+                    try:
+                        await self._place([order], statuses, items)
+                    except (IntegrityError, DataError) as error:
+                        logger.error(f"Order {order['token']} was not saved: {error}")
+                        statuses[order['token']] = {
+                            'status': FAILED,
+                            'code': 500,
+                            'detail': f"Order could not be saved"
+                        }
+
+            async with redis.pipeline(transaction=False) as pipe:
+                for order in orders:
+                    pipe.set(
+                        status_key(order['token']),
+                        json.dumps(
+                            statuses[order['token']] | {'customer_id': order['customer_id']}
+                        ),
+                        ex=setting.ORDER_STATUS_TTL
+                    )
+                await pipe.execute()
+
+            for order in orders:
+                if order['token'] in items:
+                    seller_order(items[order['token']])
+                    customer_order(items[order['token']], order['email'])
+
+        ids = [entry_id for entry_id, _ in entries]
+        async with redis.pipeline(transaction=False) as pipe:
+            pipe.xack(self.stream, self.group, *ids)
+            pipe.xdel(self.stream, *ids)
+            await pipe.execute()
+
+    async def _place(self, orders: list[dict], statuses: dict, items: dict) -> None:
+        tokens = [order['token'] for order in orders]
+        async with a_session() as session:
+            # the tokens are claimed in the transaction that places the
+            # orders: a redelivered entry finds its token taken and only
+            # reads the order id, a concurrent claim waits for this commit
+            stmt = \
+                insert(
+                    OrderToken
+                ).values(
+                    [{'token': token} for token in tokens]
+                ).on_conflict_do_nothing().returning(
+                    OrderToken.token
+                )
+            claimed = set((await session.execute(stmt)).scalars().all())
+
+            query = \
+                select(
+                    OrderToken.token,
+                    OrderToken.order_id
+                ).filter(
+                    OrderToken.token.in_(set(tokens) - claimed)
+                )
+            for token, order_id in (await session.execute(query)).all():
+                statuses[token] = {'status': PLACED, 'order_id': order_id}
+
+            fresh = [order for order in orders if order['token'] in claimed]
+            results = await place_orders(
+                session,
+                [
+                    OrderRequest(
+                        order['customer_id'],
+                        order['country'],
+                        order['products'],
+                        order['counts']
+                    )
+                    for order in fresh
+                ]
+            ) if fresh else []
+
+            placed = {}
+            for order, result in zip(fresh, results):
+                if isinstance(result, Exception):
+                    statuses[order['token']] = {
+                        'status': FAILED,
+                        'code': error_code(result),
+                        'detail': str(result)
+                    }
+                else:
+                    statuses[order['token']] = {'status': PLACED, 'order_id': result}
+                    placed[order['token']] = result
+
+            # a failed order frees its token, retrying it cannot duplicate it
+            failed = [order['token'] for order in fresh if order['token'] not in placed]
+            if failed:
+                stmt = \
+                    delete(
+                        OrderToken
+                    ).filter(
+                        OrderToken.token.in_(failed)
+                    )
+                await session.execute(stmt)
+            if placed:
+                await session.execute(
+                    update(OrderToken),
+                    [
+                        {'token': token, 'order_id': order_id}
+                        for token, order_id in placed.items()
+                    ]
+                )
+
+                query = \
+                    select(
+                        OrderDetail.order_id,
+                        User.email,
+                        Good.product_name,
+                        OrderDetail.quantity
+                    ).join(
+                        Good, Good.id == OrderDetail.good_id
+                    ).join(
+                        User, User.id == Good.seller_id
+                    ).filter(
+                        OrderDetail.order_id.in_(list(placed.values()))
+                    )
+                lines = {}
+                for order_id, *item in (await session.execute(query)).all():
+                    lines.setdefault(order_id, []).append(tuple(item))
+                for token, order_id in placed.items():
+                    items[token] = lines.get(order_id, [])
+
+            await session.commit()
+
+
+order_intake = OrderIntake(
+    setting.ORDER_INTAKE_STREAM,
+    setting.ORDER_INTAKE_GROUP,
+    setting.ORDER_INTAKE_BATCH
+)
@@ -1,8 +1,11 @@
-from datetime import datetime
+from datetime import date, datetime
+from typing import Optional
 import enum
 
 from sqlalchemy.orm import Mapped, mapped_column, relationship
-from sqlalchemy import TIMESTAMP, ForeignKey, Enum
+from sqlalchemy import TIMESTAMP, CheckConstraint, ForeignKey, \
+                       ForeignKeyConstraint, Enum, Index, DDL, event, func, \
+                       literal_column, text
 
 from database import Base
 
@@ -16,6 +19,12 @@ class CategoryType(str, enum.Enum):
 
 class Good(Base):
     __tablename__ = 'good'
+    __table_args__ = (
+        Index('ix_good_seller_id_id', 'seller_id', 'id'),
+        Index('ix_good_category_id_unit_price', 'category_id', 'unit_price', 'id'),
+        Index('ix_good_unit_price_id', 'unit_price', 'id'),
+        CheckConstraint('stock >= 0', name='ck_good_stock'),
+    )
 
     id: Mapped[int] = mapped_column(
         primary_key=True, autoincrement=True
@@ -32,6 +41,14 @@ class Good(Base):
     unit_price: Mapped[float] = mapped_column(
         nullable=False
     )
+    # NULL means the seller does not track stock for this good
+    stock: Mapped[Optional[int]] = mapped_column(
+        nullable=True
+    )
+    # a hot good keeps its stock in this many good_stock_shard rows
+    stock_shards: Mapped[int] = mapped_column(
+        nullable=False, default=0, server_default='0'
+    )
 
     users = relationship(
         'User', 
@@ -46,8 +63,40 @@ class Good(Base):
         back_populates='goods'
     )
 
+# the search has to repeat this exact expression to hit the GIN index
+def product_name_tsv():
+    return func.to_tsvector(
+        literal_column("'simple'::regconfig"), Good.product_name
+    )
+
+
+Index(
+    'ix_good_product_name_tsv',
+    product_name_tsv(),
+    postgresql_using='gin'
+)
+
+Index(
+    'ix_good_product_name_trgm',
+    Good.product_name,
+    postgresql_using='gin',
+    postgresql_ops={'product_name': 'gin_trgm_ops'}
+)
+
+event.listen(
+    Good.__table__,
+    'before_create',
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+)
+
 class Order(Base):
     __tablename__ = 'order'
+    __table_args__ = (
+        Index('ix_order_customer_id_date_order_id', 'customer_id', 'date_order', 'id'),
+        Index('ix_order_id_not_rolled_up', 'id', postgresql_where=text('NOT rolled_up')),
+        # monthly partitions are kept by tasks.partitions
+        {'postgresql_partition_by': 'RANGE (date_order)'},
+    )
 
     id: Mapped[int] = mapped_column(
         primary_key=True, autoincrement=True
@@ -57,11 +106,21 @@ class Order(Base):
         ForeignKey("user.id", ondelete='CASCADE')
     )
     date_order: Mapped[datetime] = mapped_column(
-        TIMESTAMP(timezone=True), default=datetime.now()
+        TIMESTAMP(timezone=True), primary_key=True, default=func.now()
     )
     ship_country: Mapped[str] = mapped_column(
         nullable=False
     )
+    total_amount: Mapped[float] = mapped_column(
+        nullable=False, default=0, server_default='0'
+    )
+    item_count: Mapped[int] = mapped_column(
+        nullable=False, default=0, server_default='0'
+    )
+    # set once the lines are counted in sales_daily
+    rolled_up: Mapped[bool] = mapped_column(
+        nullable=False, default=False, server_default='false'
+    )
 
     customer = relationship(
         'User', 
@@ -76,6 +135,20 @@ class Order(Base):
     )
 
 
+# order intake tokens; order is partitioned, so a unique token cannot live
+# on the order row itself
+class OrderToken(Base):
+    __tablename__ = 'order_token'
+
+    token: Mapped[str] = mapped_column(
+        primary_key=True
+    )
+    order_id: Mapped[Optional[int]]
+    created: Mapped[datetime] = mapped_column(
+        TIMESTAMP(timezone=True), nullable=False, server_default=func.now()
+    )
+
+
 class Category(Base):
     __tablename__ = 'category'
 
@@ -95,13 +168,26 @@ class Category(Base):
 
 class OrderDetail(Base):
     __tablename__ = 'order_detail'
+    __table_args__ = (
+        ForeignKeyConstraint(
+            ['order_id', 'date_order'],
+            ['order.id', 'order.date_order'],
+            ondelete='CASCADE'
+        ),
+        Index('ix_order_detail_good_id', 'good_id'),
+        {'postgresql_partition_by': 'RANGE (date_order)'},
+    )
 
     order_id: Mapped[int] = mapped_column(
-        ForeignKey('order.id', ondelete='CASCADE'), primary_key=True
+        primary_key=True
     )
     good_id: Mapped[int] = mapped_column(
         ForeignKey('good.id', ondelete='CASCADE'), primary_key=True
     )
+    # copied from the order, so lines live in the same month partition
+    date_order: Mapped[datetime] = mapped_column(
+        TIMESTAMP(timezone=True), primary_key=True
+    )
     quantity: Mapped[int] = mapped_column(
         nullable=False
     )
@@ -116,4 +202,77 @@ class OrderDetail(Base):
     goods = relationship(
         'Good',
         back_populates='od'
-    )
\ No newline at end of file
+    )
+
+# rows outside every monthly partition land here
+event.listen(
+    Order.__table__,
+    'after_create',
+    DDL('CREATE TABLE IF NOT EXISTS "order_default" PARTITION OF "order" DEFAULT')
+)
+
+event.listen(
+    OrderDetail.__table__,
+    'after_create',
+    DDL('CREATE TABLE IF NOT EXISTS "order_detail_default" '
+        'PARTITION OF "order_detail" DEFAULT')
+)
+
+
+class GoodStockShard(Base):
+    __tablename__ = 'good_stock_shard'
+    __table_args__ = (
+        CheckConstraint('stock >= 0', name='ck_good_stock_shard_stock'),
+    )
+
+    good_id: Mapped[int] = mapped_column(
+        ForeignKey('good.id', ondelete='CASCADE'), primary_key=True
+    )
+    shard: Mapped[int] = mapped_column(
+        primary_key=True
+    )
+    stock: Mapped[int] = mapped_column(
+        nullable=False, default=0
+    )
+
+
+class SalesDaily(Base):
+    __tablename__ = 'sales_daily'
+    __table_args__ = (
+        Index('ix_sales_daily_good_id_day', 'good_id', 'day'),
+    )
+
+    seller_id: Mapped[int] = mapped_column(
+        ForeignKey('user.id', ondelete='CASCADE'), primary_key=True
+    )
+    day: Mapped[date] = mapped_column(
+        primary_key=True
+    )
+    good_id: Mapped[int] = mapped_column(
+        ForeignKey('good.id', ondelete='CASCADE'), primary_key=True
+    )
+    quantity: Mapped[int] = mapped_column(
+        nullable=False, default=0
+    )
+    revenue: Mapped[float] = mapped_column(
+        nullable=False, default=0
+    )
+    orders: Mapped[int] = mapped_column(
+        nullable=False, default=0
+    )
+
+
+class CategoryPriceStats(Base):
+    __tablename__ = 'category_price_stats'
+
+    category_id: Mapped[int] = mapped_column(
+        ForeignKey('category.id', ondelete='CASCADE'), primary_key=True
+    )
+    good_count: Mapped[int] = mapped_column(
+        nullable=False, default=0
+    )
+    price_sum: Mapped[float] = mapped_column(
+        nullable=False, default=0
+    )
+    min_price: Mapped[Optional[float]]
+    max_price: Mapped[Optional[float]]
@@ -0,0 +1,128 @@
+import asyncio
+import logging
+from typing import Optional, Union
+
+from sqlalchemy.exc import DataError, IntegrityError
+
+from management.orders import OrderRequest, place_orders
+from database import a_session
+from config import setting
+
+
+logger = logging.getLogger(__name__)
+
+
+class OrderWriterDown(Exception):
+    pass
+
+
+class OrderWriter:
+
+    def __init__(self, window: float, max_batch: int, timeout: float) -> None:
+        self.window = window
+        self.max_batch = max_batch
+        self.timeout = timeout
+        self._queue = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+        self._batch: list = []
+        self._writing: set = set()
+
+    async def submit(self, request: OrderRequest) -> int:
+        if self._task is None or self._task.done():
+            raise OrderWriterDown(f"Order writer is not running")
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((request, future))
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), self.timeout)
+        except asyncio.TimeoutError:
+            # an order whose batch is committing is waited for, its outcome
+            # is not known yet; one still waiting is dropped and never written
+            if future in self._writing:
+                return await future
+            future.cancel()
+            raise
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+        # nobody is left to write what is still waiting
+        waiting = self._batch
+        while not self._queue.empty():
+            waiting.append(self._queue.get_nowait())
+        for _, future in waiting:
+            if not future.done():
+                future.set_exception(OrderWriterDown(f"Order writer was stopped"))
+        self._batch = []
+
+    async def _run(self) -> None:
+        # while one batch commits, the next one gathers in the queue
+        loop = asyncio.get_running_loop()
+        while True:
+            self._batch = batch = [await self._queue.get()]
+            deadline = loop.time() + self.window
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            await self._write(batch)
+            self._batch = []
+
+    async def _place(self, requests: list[OrderRequest]) -> list[Union[int, Exception]]:
+        async with a_session() as session:
+            results = await place_orders(session, requests)
+            await session.commit()
+        return results
+
+    async def _place_one(self, request: OrderRequest) -> Union[int, Exception]:
+        try:
+            return (await self._place([request]))[0]
+        except (IntegrityError, DataError) as error:
+            logger.error(f"Order of customer {request.customer_id} was not saved: {error}")
+            return error
+
+    async def _write(self, batch: list) -> None:
+        batch = [item for item in batch if not item[1].done()]
+        if not batch:
+            return
+        requests = [request for request, _ in batch]
+        self._writing = {future for _, future in batch}
+        try:
+            try:
+                results = await self._place(requests)
+            except (IntegrityError, DataError) as error:
+                # a bad order must not hold back the rest of the batch
+                logger.warning(f"Order batch of {len(batch)} failed, retrying one by one: {error}")
+                results = [await self._place_one(request) for request in requests]
+        except Exception as error:
+            logger.warning(f"Order batch of {len(batch)} failed: {error}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(error)
+            return
+        finally:
+            self._writing = set()
+
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+
+order_writer = OrderWriter(
+    setting.ORDER_WRITER_WINDOW,
+    setting.ORDER_WRITER_BATCH,
+    setting.ORDER_WRITER_TIMEOUT
+)
@@ -0,0 +1,245 @@
+from typing import NamedTuple, Union
+
+from sqlalchemy import Integer, delete, func, insert, literal, select, update
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from management.models import Good, Order, OrderDetail
+from management.stock import OutOfStock, reserve_stock
+
+
+class OrderRequest(NamedTuple):
+    customer_id: int
+    country: str
+    products: list[int]
+    counts: list[int]
+
+
+def order_lines(order_ids: list[int], products: list[int], counts: list[int]):
+    # a repeated good becomes one line with the summed quantity
+    lines = \
+        func.unnest(
+            literal(order_ids, ARRAY(Integer)),
+            literal(products, ARRAY(Integer)),
+            literal(counts, ARRAY(Integer))
+        ).table_valued(
+            'order_id', 'good_id', 'quantity'
+        ).render_derived(
+            name='lines'
+        )
+
+    return \
+        select(
+            lines.c.order_id,
+            lines.c.good_id,
+            func.sum(lines.c.quantity).label('quantity')
+        ).group_by(
+            lines.c.order_id,
+            lines.c.good_id
+        ).subquery('grouped')
+
+def check_order(products: list[int], counts: list[int]) -> None:
+    if not products:
+        raise ValueError(f"Order is empty")
+    if len(products) != len(counts):
+        raise ValueError(f"Lists of goods and counts have different length")
+    if any(count <= 0 for count in counts):
+        raise ValueError(f"Count of good must be positive")
+
+async def insert_lines(
+    session: AsyncSession,
+    order_ids: list[int],
+    products: list[int],
+    counts: list[int]
+) -> set[tuple[int, int]]:
+
+    # line prices come from the good rows read inside this transaction,
+    # and the order totals are written by the same statement; now() is
+    # the transaction start, so it equals the date_order of the orders
+    lines = order_lines(order_ids, products, counts)
+    inserted = \
+        insert(
+            OrderDetail
+        ).from_select(
+            ['order_id', 'good_id', 'date_order', 'quantity', 'price'],
+            select(
+                lines.c.order_id,
+                lines.c.good_id,
+                func.now(),
+                lines.c.quantity,
+                Good.unit_price * lines.c.quantity
+            ).join(
+                Good, Good.id == lines.c.good_id
+            )
+        ).returning(
+            OrderDetail.order_id,
+            OrderDetail.good_id,
+            OrderDetail.quantity,
+            OrderDetail.price
+        ).cte('inserted')
+
+    totals = \
+        select(
+            inserted.c.order_id,
+            func.sum(inserted.c.price).label('total_amount'),
+            func.sum(inserted.c.quantity).label('item_count')
+        ).group_by(
+            inserted.c.order_id
+        ).subquery('totals')
+    summed = \
+        update(
+            Order
+        ).filter(
+            Order.id == totals.c.order_id,
+            Order.date_order == func.now()
+        ).values(
+            total_amount=totals.c.total_amount,
+            item_count=totals.c.item_count
+        ).cte('summed')
+
+    query = \
+        select(
+            inserted.c.order_id,
+            inserted.c.good_id
+        ).add_cte(
+            summed
+        )
+
+    return set((await session.execute(query)).tuples().all())
+
+async def place_order(
+    session: AsyncSession,
+    customer_id: int,
+    country: str,
+    products: list[int],
+    counts: list[int]
+) -> int:
+
+    check_order(products, counts)
+
+    stmt = \
+        insert(
+            Order
+        ).values(
+            customer_id=customer_id,
+            ship_country=country
+        ).returning(
+            Order.id
+        )
+    order_id = (await session.execute(stmt)).scalar()
+
+    placed = await insert_lines(
+        session, [order_id] * len(products), products, counts
+    )
+
+    missing = sorted({(order_id, item) for item in products} - placed)
+    if missing:
+        raise LookupError(f"Goods {[item for _, item in missing]} are not exists")
+
+    # last, so the good rows stay locked only until the commit
+    short = await reserve_stock(session, products, counts)
+    if short:
+        raise OutOfStock(short)
+
+    return order_id
+
+async def place_orders(
+    session: AsyncSession,
+    requests: list[OrderRequest]
+) -> list[Union[int, Exception]]:
+
+    # every order of the batch shares the same few statements;
+    # a bad order fails alone and the rest are kept
+    results = [None] * len(requests)
+    valid = []
+    for numb, item in enumerate(requests):
+        try:
+            check_order(item.products, item.counts)
+        except ValueError as error:
+            results[numb] = error
+            continue
+        valid.append(numb)
+    if not valid:
+        return results
+
+    # ids come first, so each order knows its own id without relying on
+    # the order of rows returned by a multi-row insert
+    query = \
+        select(
+            func.nextval('order_id_seq')
+        ).select_from(
+            func.generate_series(1, len(valid))
+        )
+    ids = (await session.execute(query)).scalars().all()
+
+    stmt = \
+        insert(
+            Order
+        ).values([
+            {
+                'id': order_id,
+                'customer_id': requests[numb].customer_id,
+                'ship_country': requests[numb].country
+            }
+            for numb, order_id in zip(valid, ids)
+        ])
+    await session.execute(stmt)
+
+    placed = await insert_lines(
+        session,
+        [order_id for numb, order_id in zip(valid, ids) for _ in requests[numb].products],
+        [good for numb in valid for good in requests[numb].products],
+        [count for numb in valid for count in requests[numb].counts]
+    )
+
+    failed = []
+    for numb, order_id in zip(valid, ids):
+        missing = sorted(
+            item for item in set(requests[numb].products) if (order_id, item) not in placed
+        )
+        if missing:
+            results[numb] = LookupError(f"Goods {missing} are not exists")
+            failed.append(order_id)
+        else:
+            results[numb] = order_id
+
+    ready = [
+        (numb, order_id) for numb, order_id in zip(valid, ids)
+        if results[numb] == order_id
+    ]
+    try:
+        # the whole batch reserves at once while stock lasts
+        async with session.begin_nested():
+            short = await reserve_stock(
+                session,
+                [good for numb, _ in ready for good in requests[numb].products],
+                [count for numb, _ in ready for count in requests[numb].counts]
+            )
+            if short:
+                raise OutOfStock(short)
+    except OutOfStock:
+        # otherwise each order reserves on its own and a short one is
+        # rolled back to its savepoint and dropped
+        for numb, order_id in ready:
+            try:
+                async with session.begin_nested():
+                    short = await reserve_stock(
+                        session, requests[numb].products, requests[numb].counts
+                    )
+                    if short:
+                        raise OutOfStock(short)
+            except OutOfStock as error:
+                results[numb] = error
+                failed.append(order_id)
+
+    if failed:
+        await session.execute(
+            delete(
+                Order
+            ).filter(
+                Order.id.in_(failed),
+                Order.date_order == func.now()
+            )
+        )
+
+    return results
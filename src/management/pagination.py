@@ -0,0 +1,54 @@
+import base64
+import json
+from datetime import datetime, timedelta, timezone
+from typing import Any, Optional
+
+from fastapi import HTTPException, Query
+
+
+PAGE_LIMIT = 50
+PAGE_LIMIT_MAX = 500
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def page_limit(
+    limit: int = Query(default=PAGE_LIMIT, ge=1, le=PAGE_LIMIT_MAX)
+) -> int:
+    return limit
+
+def encode_cursor(*values: Any) -> str:
+    raw = json.dumps(values, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+# timestamps travel in cursors as whole microseconds, so they compare exactly
+def encode_time(value: datetime) -> int:
+    return (value - EPOCH) // timedelta(microseconds=1)
+
+def decode_time(value: int) -> datetime:
+    try:
+        return EPOCH + timedelta(microseconds=int(value))
+    except (OverflowError, OSError, ValueError):
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid cursor"
+        )
+
+def decode_cursor(cursor: Optional[str], size: int) -> Optional[list]:
+    if cursor is None:
+        return None
+
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except ValueError:
+        values = None
+
+    if not isinstance(values, list) or len(values) != size or \
+            any(isinstance(item, bool) or not isinstance(item, (int, float))
+                for item in values):
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid cursor"
+        )
+    return values
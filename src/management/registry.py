@@ -0,0 +1,74 @@
+import time
+from typing import Optional
+
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from management.models import Category, CategoryType
+
+
+# other workers learn about category writes only through this timeout
+REGISTRY_MAX_AGE = 300
+
+
+class CategoryRegistry:
+
+    def __init__(self) -> None:
+        self._ids: dict[CategoryType, int] = {}
+        self._names: dict[int, CategoryType] = {}
+        self._loaded_at: Optional[float] = None
+
+    @property
+    def is_stale(self) -> bool:
+        return self._loaded_at is None or \
+            time.monotonic() - self._loaded_at > REGISTRY_MAX_AGE
+
+    def invalidate(self) -> None:
+        self._loaded_at = None
+
+    async def load(self, session: AsyncSession) -> None:
+        query = \
+            select(
+                Category.id,
+                Category.category_name
+            )
+
+        temp = (await session.execute(query)).all()
+        self._ids = {item.category_name: item.id for item in temp}
+        self._names = {item.id: item.category_name for item in temp}
+        self._loaded_at = time.monotonic()
+
+    async def get_id(
+        self,
+        category: CategoryType,
+        session: AsyncSession
+    ) -> Optional[int]:
+
+        if self.is_stale or category not in self._ids:
+            await self.load(session)
+        return self._ids.get(category)
+
+    async def get_name(
+        self,
+        category_id: int,
+        session: AsyncSession
+    ) -> Optional[CategoryType]:
+
+        if self.is_stale or category_id not in self._names:
+            await self.load(session)
+        return self._names.get(category_id)
+
+    async def get_names(self, session: AsyncSession) -> dict[int, CategoryType]:
+        if self.is_stale:
+            await self.load(session)
+        return dict(self._names)
+
+
+registry = CategoryRegistry()
+
+
+@event.listens_for(Category, 'after_insert')
+@event.listens_for(Category, 'after_update')
+@event.listens_for(Category, 'after_delete')
+def invalidate_registry(mapper, connection, target) -> None:
+    registry.invalidate()
@@ -1,16 +1,53 @@
+import asyncio
+import logging
+from datetime import date, datetime
 from typing import Union, Optional
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, \
+                    Request, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import delete, insert, select, func, update
+from sqlalchemy import JSON, Float, Integer, and_, cast, column, delete, \
+                       func, insert, literal_column, or_, select, tuple_, \
+                       update, values
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+from redis.exceptions import RedisError
 
 from tasks.email_msg import customer_order, seller_order
-from management.schemas import AddGood, AddOrder, GoodSeller, MyOrder
-from management.models import Good, Category, CategoryType, Order, OrderDetail
+from management.schemas import AddGood, AddOrder, GoodSeller, MyOrder, \
+                               GoodPage, MyGoodPage, BulkError, BulkResult, \
+                               PriceChange, CategoryStats, MyOrderPage, \
+                               OrderStatus, SalesDay, SalesGood
+from management.models import Good, CategoryType, Order, \
+                              OrderDetail, CategoryPriceStats, \
+                              GoodStockShard, SalesDaily, product_name_tsv
+from management.registry import registry
+from management.pagination import page_limit, encode_cursor, decode_cursor, \
+                                  encode_time, decode_time
+from management.export import ExportFormat, media_type, stream_goods
+from management.bulk import CHUNK_SIZE, MAX_ERRORS, read_lines, read_csv, \
+                            read_ndjson, parse_good, create_staging, \
+                            copy_chunk, merge_staging, good_import
+from management.stats import add_prices, replace_prices
+from management.facets import FACET_BUCKET_WIDTH, facet_column, parse_facets
+from management.snapshot import notify_catalog, search_page
+from management.orders import OrderRequest, check_order, place_order
+from management.stock import MAX_SHARDS, OutOfStock, rebalance, \
+                             release_stock
+from management.order_writer import OrderWriterDown, order_writer
+from management.intake import enqueue_order, order_status
+from management.sales import sales_range, unroll_statement
 from auth.base_config import fastapi_users
 from auth.models import User, RoleType
 from database import get_async_session
+from config import setting
+from cache import CATALOG_VERSION, bump_versions, cached_read, run_once, \
+                  seller_version
 
 
+logger = logging.getLogger(__name__)
+
+PRICE_BATCH_SIZE = 10000
+
 router_good = APIRouter(
     prefix='/goods',
     tags=['Goods operations']
@@ -39,30 +76,28 @@ async def add_good(
             detail=f"Seller is not verified!"
         )
     user_id = user.id
-
-    query = \
-        select(
-            Category.id
-        ).filter(
-            Category.category_name == data.good_category
-        )
     
     try:    
-        cat_id = (await session.execute(query)).first()
+        cat_id = await registry.get_id(data.good_category, session)
+        if cat_id is None:
+            raise ValueError(f"Category {data.good_category} is not exists")
         product = {
             "product_name": data.good_name,
             "seller_id": user_id,
-            "category_id": cat_id.id,
+            "category_id": cat_id,
             "unit_price": data.good_price
         }
         # session.add(product)
         stmt = \
             insert(
                 Good
-            ).values(product)
+            ).values(product).returning(Good.id)
         
-        await session.execute(stmt)
+        good_id = (await session.execute(stmt)).scalar()
+        await replace_prices(session, added=[(cat_id, data.good_price)])
+        await notify_catalog(session, [good_id])
         await session.commit()
+        await bump_versions(user_id)
         return f"Good {product['product_name']} was added"
     except Exception as e:
         raise HTTPException(
@@ -70,197 +105,724 @@ async def add_good(
             detail=str(e)
         )
 
-@router_good.get('/my_goods', response_model=Union[list[AddGood], str])
+@router_good.post('/bulk', response_model=BulkResult)
+async def add_goods_bulk(
+    request: Request,
+    user = Depends(fastapi_users.current_user()),
+    session: AsyncSession = Depends(get_async_session)
+) -> BulkResult:
+    
+    if user.role != RoleType.seller:
+        raise HTTPException(
+            status_code=491,
+            detail=f"Operations with goods only for sellers!"
+        )
+    elif not user.is_verified:
+        raise HTTPException(
+            status_code=492,
+            detail=f"Seller is not verified!"
+        )
+
+    content_type = request.headers.get('content-type', '').split(';')[0]
+    if content_type == 'text/csv':
+        rows = read_csv(read_lines(request.stream()))
+    elif content_type in ('application/x-ndjson', 'application/ndjson'):
+        rows = read_ndjson(read_lines(request.stream()))
+    else:
+        raise HTTPException(
+            status_code=415,
+            detail=f"Upload must be text/csv or application/x-ndjson"
+        )
+
+    errors = []
+    records = []
+    numb = 0
+    try:
+        await create_staging(session)
+        async for row in rows:
+            numb += 1
+            if row is None:
+                continue
+            record, error = await parse_good(row, session)
+            if error:
+                if len(errors) < MAX_ERRORS:
+                    errors.append(BulkError(row=numb, error=error))
+                continue
+            records.append(record)
+            if len(records) >= CHUNK_SIZE:
+                await copy_chunk(session, records)
+                records = []
+        if records:
+            await copy_chunk(session, records)
+
+        inserted = await merge_staging(session, user.id)
+        await add_prices(session, good_import)
+        await notify_catalog(session)
+        await session.commit()
+    except Exception as e:
+        await session.rollback()
+        raise HTTPException(
+            status_code=501,
+            detail=str(e)
+        )
+
+    if inserted:
+        await bump_versions(user.id)
+    return BulkResult(inserted=inserted, errors=errors)
+
+@router_good.get('/my_goods', response_model=Union[MyGoodPage, str])
 async def get_goods(
+    request: Request,
+    cursor: Optional[str] = None,
+    limit: int = Depends(page_limit),
     user = Depends(fastapi_users.current_user()),
     session: AsyncSession = Depends(get_async_session)
-) -> Union[list[AddGood], str]:
+) -> Response:
+
+    async def build() -> Union[MyGoodPage, str]:
+        query = \
+            select(
+                Good.id,
+                Good.product_name,
+                Good.category_id,
+                Good.unit_price
+            ).filter(
+                Good.seller_id == user.id
+            ).order_by(
+                Good.id
+            ).limit(
+                limit + 1
+            )
+
+        last = decode_cursor(cursor, 1)
+        if last:
+            query = query.filter(Good.id > last[0])
+    
+        temp = (await session.execute(query)).all()
+        result = [
+            AddGood(
+                good_name=item.product_name,
+                good_category=await registry.get_name(item.category_id, session),
+                good_price=item.unit_price
+            )
+            for item in temp[:limit]
+        ]
+        next_cursor = encode_cursor(temp[limit - 1].id) \
+            if len(temp) > limit else None
+    
+        return MyGoodPage(items=result, next_cursor=next_cursor) \
+            if result else f"Nothing"
+
+    return await cached_read(
+        request,
+        f'goods:my',
+        seller_version(user.id),
+        {'cursor': cursor, 'limit': limit},
+        build
+    )
+
+@router_good.get('/seller/{id}', response_model=Union[GoodPage, str])
+async def goods_seller(
+    request: Request,
+    id: int,
+    cursor: Optional[str] = None,
+    limit: int = Depends(page_limit),
+    session: AsyncSession = Depends(get_async_session)
+) -> Response:
+
+    async def build() -> Union[GoodPage, str]:
+        query = \
+            select(
+                Good.id,
+                User.username,
+                Good.product_name,
+                Good.category_id,
+                Good.unit_price
+            ).join(
+                User, User.id == Good.seller_id
+            ).filter(
+                Good.seller_id == id
+            ).order_by(
+                Good.id
+            ).limit(
+                limit + 1
+            )
+
+        last = decode_cursor(cursor, 1)
+        if last:
+            query = query.filter(Good.id > last[0])
+    
+        temp = (await session.execute(query)).all()
+        result = [
+            GoodSeller(
+                seller_name=item.username,
+                good_name=item.product_name,
+                good_category=await registry.get_name(item.category_id, session),
+                good_price=item.unit_price
+            )
+            for item in temp[:limit]
+        ]
+        next_cursor = encode_cursor(temp[limit - 1].id) \
+            if len(temp) > limit else None
+    
+        return GoodPage(items=result, next_cursor=next_cursor) \
+            if result else f"This seller without goods!"
+
+    return await cached_read(
+        request,
+        f'goods:seller',
+        seller_version(id),
+        {'cursor': cursor, 'limit': limit},
+        build
+    )
+
+@router_good.get('/search', response_model=Union[GoodPage, None, str])
+async def find_by_filter(
+    request: Request,
+    category: Optional[CategoryType] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    q: Optional[str] = Query(default=None, min_length=1, max_length=200),
+    cursor: Optional[str] = None,
+    limit: int = Depends(page_limit),
+    facets: bool = False,
+    bucket_width: float = Query(default=FACET_BUCKET_WIDTH, gt=0),
+    session: AsyncSession = Depends(get_async_session)
+) -> Response:
+
+    # plain price/category pages come from the shared snapshot when it is on;
+    # it trails commits by a notification, so its pages skip the Redis cache
+    if setting.CATALOG_SNAPSHOT and not q and not facets:
+        cat_id = await registry.get_id(category, session) if category else None
+        if category and cat_id is None:
+            raise HTTPException(
+                status_code=550,
+                detail=f"Goods are not exists"
+            )
+        page = await search_page(cat_id, min_price, max_price, cursor, limit, session)
+        if page is not None:
+            return page
+
+    async def build() -> Union[GoodPage, str]:
+        # missing bounds stay open, so the search is always one statement
+        filters = []
+        if category:
+            cat_id = await registry.get_id(category, session)
+            if cat_id is None:
+                raise HTTPException(
+                    status_code=550,
+                    detail=f"Goods are not exists"
+                )
+            filters.append(Good.category_id == cat_id)
+        if min_price is not None:
+            filters.append(Good.unit_price >= min_price)
+        if max_price is not None:
+            filters.append(Good.unit_price <= max_price)
+
+        # keyset on (unit_price, id): every page costs the same as the first,
+        # a name search pages on (rank, id) instead
+        last = decode_cursor(cursor, 2)
+        keyset = []
+        if q:
+            tsq = func.websearch_to_tsquery(literal_column("'simple'::regconfig"), q)
+            pattern = q.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            sort_key = cast(
+                func.ts_rank(product_name_tsv(), tsq) + \
+                    func.similarity(Good.product_name, q),
+                Float
+            )
+            filters.append(
+                or_(
+                    product_name_tsv().op('@@')(tsq),
+                    Good.product_name.op('%')(q),
+                    Good.product_name.ilike(f"%{pattern}%", escape='\\')
+                )
+            )
+            if last:
+                keyset.append(
+                    or_(
+                        sort_key < last[0],
+                        and_(sort_key == last[0], Good.id > last[1])
+                    )
+                )
+            order = (sort_key.desc(), Good.id)
+        else:
+            sort_key = Good.unit_price
+            if last:
+                keyset.append(tuple_(Good.unit_price, Good.id) > tuple_(*last))
+            order = (Good.unit_price, Good.id)
+
+        columns = [
+            Good.id,
+            Good.product_name,
+            User.username,
+            Good.category_id,
+            Good.unit_price,
+            sort_key.label('sort_key')
+        ]
+        # facets cover the whole result, not only this page
+        if facets:
+            columns.append(facet_column(filters, bucket_width))
+
+        query = \
+            select(
+                *columns
+            ).join(
+                User, User.id == Good.seller_id
+            ).filter(
+                *filters,
+                *keyset
+            ).order_by(
+                *order
+            ).limit(
+                limit + 1
+            )
+    
+        temp = (await session.execute(query)).all()
+        result = [
+            GoodSeller(
+                seller_name=item.username,
+                good_name=item.product_name,
+                good_category=await registry.get_name(item.category_id, session),
+                good_price=item.unit_price
+            )
+            for item in temp[:limit]
+        ]
+        next_cursor = encode_cursor(
+            temp[limit - 1].sort_key, temp[limit - 1].id
+        ) if len(temp) > limit else None
+
+        if not result:
+            return f"Goods to params are not found"
+
+        facet_data = parse_facets(
+            temp[0].facets, await registry.get_names(session), bucket_width
+        ) if facets else None
+        return GoodPage(items=result, next_cursor=next_cursor, facets=facet_data)
+
+    return await cached_read(
+        request,
+        f'goods:search',
+        CATALOG_VERSION,
+        {
+            'category': category,
+            'min_price': min_price,
+            'max_price': max_price,
+            'q': q,
+            'cursor': cursor,
+            'limit': limit,
+            'facets': facets,
+            'bucket_width': bucket_width if facets else None
+        },
+        build
+    )
+
+@router_good.get('/stats', response_model=list[CategoryStats])
+async def category_stats(
+    category: Optional[CategoryType] = None,
+    session: AsyncSession = Depends(get_async_session)
+) -> list[CategoryStats]:
     
     query = \
         select(
-            Good.product_name,
-            Category.category_name,
-            Good.unit_price
-        ).join(
-            Good, Good.category_id == Category.id
-        ).group_by(
-            Good.product_name,
-            Category.category_name,
-            Good.unit_price
-        ).filter(
-            Good.seller_id == user.id
+            CategoryPriceStats
+        ).order_by(
+            CategoryPriceStats.category_id
         )
-    
-    temp = (await session.execute(query)).all()
+    if category:
+        cat_id = await registry.get_id(category, session)
+        query = query.filter(CategoryPriceStats.category_id == cat_id)
+
+    temp = (await session.execute(query)).scalars().all()
     result = [
-        AddGood(
-            good_name=item.product_name,
-            good_category=item.category_name,
-            good_price=item.unit_price
+        CategoryStats(
+            category=await registry.get_name(item.category_id, session),
+            good_count=item.good_count,
+            min_price=item.min_price,
+            max_price=item.max_price,
+            avg_price=item.price_sum / item.good_count if item.good_count else None
         )
         for item in temp
     ]
-    
-    return result if result else f"Nothing"
 
-@router_good.get('/seller/{id}', response_model=Union[list[GoodSeller], str])
-async def goods_seller(
-    id: int,
+    return result
+
+@router_good.get('/export', response_class=StreamingResponse)
+async def export_goods(
+    export_format: ExportFormat = Query(default=ExportFormat.ndjson, alias='format'),
+    seller_id: Optional[int] = None,
+    category: Optional[CategoryType] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
     session: AsyncSession = Depends(get_async_session)
-) -> Union[list[GoodSeller], str]:
+) -> StreamingResponse:
     
+    filters = []
+    if seller_id is not None:
+        filters.append(Good.seller_id == seller_id)
+    if category:
+        cat_id = await registry.get_id(category, session)
+        if cat_id is None:
+            raise HTTPException(
+                status_code=550,
+                detail=f"Goods are not exists"
+            )
+        filters.append(Good.category_id == cat_id)
+    if min_price is not None:
+        filters.append(Good.unit_price >= min_price)
+    if max_price is not None:
+        filters.append(Good.unit_price <= max_price)
+
     query = \
         select(
+            Good.id,
+            Good.seller_id,
             User.username,
             Good.product_name,
-            Category.category_name,
+            Good.category_id,
             Good.unit_price
-        ).join(
-            Good, Good.category_id == Category.id
         ).join(
             User, User.id == Good.seller_id
-        ).group_by(
-            User.username,
-            Good.product_name,
-            Category.category_name,
-            Good.unit_price
         ).filter(
-            Good.seller_id == id
+            *filters
+        ).order_by(
+            Good.id
         )
+
+    return StreamingResponse(
+        stream_goods(query, export_format),
+        media_type=media_type(export_format)
+    )
+
+@router_good.patch('/change_price', response_model=str)
+async def change_price(
+    id: int,
+    price: float,
+    session: AsyncSession = Depends(get_async_session)
+) -> str:
     
-    temp = (await session.execute(query)).all()
-    result = [
-        GoodSeller(
-            seller_name=item.username,
-            good_name=item.product_name,
-            good_category=item.category_name,
-            good_price=item.unit_price
+    # the locked sub-select hands back the price being replaced
+    old = \
+        select(
+            Good.id,
+            Good.unit_price
+        ).filter(
+            Good.id == id
+        ).with_for_update().subquery('old')
+
+    stmt = \
+        update(
+            Good
+        ).filter(
+            Good.id == old.c.id
+        ).values(
+            unit_price = price
+        ).returning(
+            Good.seller_id,
+            Good.category_id,
+            old.c.unit_price.label('old_price')
         )
-        for item in temp
-    ]
     
-    return result if result else f"This seller without goods!"
+    seller = (await session.execute(stmt)).first()
+    if seller:
+        await replace_prices(
+            session,
+            removed=[(seller.category_id, seller.old_price)],
+            added=[(seller.category_id, price)]
+        )
+        await notify_catalog(session, [id])
+    await session.commit()
+    if seller:
+        await bump_versions(seller.seller_id)
 
-async def get_max_price(
-    category: Optional[CategoryType] = None,
+    return f"Price of good #{id} was changed"
+
+@router_good.patch('/change_price/batch', response_model=int)
+async def change_prices(
+    data: list[PriceChange],
+    user = Depends(fastapi_users.current_user()),
     session: AsyncSession = Depends(get_async_session)
-) -> Optional[float]:
+) -> int:
     
-    if not category:
-        query_price = \
-            select(
-                func.max(Good.unit_price).label('max_price')
+    if user.role != RoleType.seller:
+        raise HTTPException(
+            status_code=491,
+            detail=f"Operations with goods only for sellers!"
+        )
+    elif not user.is_verified:
+        raise HTTPException(
+            status_code=492,
+            detail=f"Seller is not verified!"
+        )
+
+    # the last price wins for a repeated good
+    changes = {item.good_id: item.price for item in data}
+    if not changes:
+        return 0
+
+    # asyncpg caps a statement at 32767 parameters
+    items = list(changes.items())
+    updated = []
+    for numb in range(0, len(items), PRICE_BATCH_SIZE):
+        prices = \
+            values(
+                column('good_id', Integer),
+                column('price', Float),
+                name='prices'
+            ).data(
+                items[numb:numb + PRICE_BATCH_SIZE]
             )
-    else:
-        query_id = \
+        old = \
             select(
-                Category.id
+                Good.id,
+                Good.unit_price
             ).filter(
-                Category.category_name == category
-            )
+                Good.id.in_([item for item, _ in items[numb:numb + PRICE_BATCH_SIZE]]),
+                Good.seller_id == user.id
+            ).with_for_update().subquery('old')
 
-        cat_id = (await session.execute(query_id)).first()
-        
-        query_price = \
-            select(
-                func.max(Good.unit_price).label('max_price')
+        stmt = \
+            update(
+                Good
             ).filter(
-                Good.category_id == cat_id.id
+                Good.id == prices.c.good_id,
+                Good.id == old.c.id,
+                Good.seller_id == user.id
+            ).values(
+                unit_price=prices.c.price
+            ).returning(
+                Good.id,
+                Good.category_id,
+                old.c.unit_price.label('old_price'),
+                Good.unit_price
             )
         
-    temp = (await session.execute(query_price)).first()
-    return temp.max_price
+        updated += (await session.execute(stmt)).all()
 
-@router_good.get('/search', response_model=Union[list[GoodSeller], None, str])
-async def find_by_filter(
-    category: Optional[CategoryType] = None,
-    min_price: Optional[float] = 0,
-    max_price: Optional[float] = None,
+    if len(updated) != len(changes):
+        await session.rollback()
+        raise HTTPException(
+            status_code=493,
+            detail=f"Goods {sorted(set(changes) - {item.id for item in updated})} "\
+                   f"are not exists or belong to another seller"
+        )
+    await replace_prices(
+        session,
+        removed=[(item.category_id, item.old_price) for item in updated],
+        added=[(item.category_id, item.unit_price) for item in updated]
+    )
+    await notify_catalog(session, [item.id for item in updated])
+    await session.commit()
+    await bump_versions(user.id)
+
+    return len(updated)
+
+@router_good.patch('/stock', response_model=str)
+async def set_stock(
+    id: int,
+    stock: Optional[int] = Query(default=None, ge=0),
+    user = Depends(fastapi_users.current_user()),
     session: AsyncSession = Depends(get_async_session)
-) -> Union[list[GoodSeller], None, str]:
+) -> str:
     
-    if not max_price:
-        try:
-            max_price = await get_max_price(category, session)
-        except Exception:
-            raise HTTPException(
-                status_code=550,
-                detail=f"Goods are not exists"
-            )
+    if user.role != RoleType.seller:
+        raise HTTPException(
+            status_code=491,
+            detail=f"Operations with goods only for sellers!"
+        )
 
-    if category:
-        query = \
-            select(
-                Good.product_name,
-                User.username,
-                Category.category_name,
-                Good.unit_price   
-            ).join(
-                Good, Good.seller_id == User.id
-            ).join(
-                Category, Category.id == Good.category_id
+    # an empty stock stops tracking the good
+    changes = {'stock': stock} if stock is not None else \
+              {'stock': None, 'stock_shards': 0}
+    stmt = \
+        update(
+            Good
+        ).filter(
+            Good.id == id,
+            Good.seller_id == user.id
+        ).values(
+            **changes
+        ).returning(
+            Good.id,
+            Good.stock_shards
+        )
+    
+    good = (await session.execute(stmt)).first()
+    if not good:
+        raise HTTPException(
+            status_code=493,
+            detail=f"Goods [{id}] are not exists or belong to another seller"
+        )
+
+    # the new stock replaces whatever the shards of a hot good still hold
+    if good.stock_shards:
+        stmt = \
+            update(
+                GoodStockShard
             ).filter(
-                Good.unit_price.between(min_price, max_price),
-                Category.category_name == category
-            ).group_by(
-                Good.product_name,
-                User.username,
-                Category.category_name,
-                Good.unit_price  
+                GoodStockShard.good_id == id
+            ).values(
+                stock=0
             )
+        await session.execute(stmt)
+        await rebalance(session, [id])
     else:
-        query = \
-            select(
-                Good.product_name,
-                User.username,
-                Category.category_name,
-                Good.unit_price   
-            ).join(
-                Good, Good.seller_id == User.id
-            ).join(
-                Category, Category.id == Good.category_id
+        stmt = \
+            delete(
+                GoodStockShard
             ).filter(
-                Good.unit_price.between(min_price, max_price)
-            ).group_by(
-                Good.product_name,
-                User.username,
-                Category.category_name,
-                Good.unit_price  
+                GoodStockShard.good_id == id
             )
-    
-    temp = (await session.execute(query)).all()
-    result = [
-        GoodSeller(
-            seller_name=item.username,
-            good_name=item.product_name,
-            good_category=item.category_name,
-            good_price=item.unit_price
-        )
-        for item in temp
-    ]
+        await session.execute(stmt)
+    await session.commit()
 
-    return result if result else f"Goods to params are not found"
+    return f"Stock of good #{id} was set to {stock}"
 
-@router_good.patch('/change_price', response_model=str)
-async def change_price(
+@router_good.patch('/hot', response_model=str)
+async def set_hot(
     id: int,
-    price: float,
+    shards: int = Query(ge=0, le=MAX_SHARDS),
+    user = Depends(fastapi_users.current_user()),
     session: AsyncSession = Depends(get_async_session)
 ) -> str:
     
+    if user.role != RoleType.seller:
+        raise HTTPException(
+            status_code=491,
+            detail=f"Operations with goods only for sellers!"
+        )
+
+    # zero shards folds the stock back into the good row
     stmt = \
         update(
             Good
         ).filter(
-            Good.id == id
+            Good.id == id,
+            Good.seller_id == user.id
         ).values(
-            unit_price = price
+            stock_shards=shards
+        ).returning(
+            Good.id,
+            Good.stock
         )
     
-    await session.execute(stmt)
+    good = (await session.execute(stmt)).first()
+    if not good:
+        raise HTTPException(
+            status_code=493,
+            detail=f"Goods [{id}] are not exists or belong to another seller"
+        )
+    if good.stock is None:
+        await session.rollback()
+        raise HTTPException(
+            status_code=494,
+            detail=f"Good #{id} does not track stock"
+        )
+    await rebalance(session, [id])
     await session.commit()
 
-    return f"Price of good #{id} was changed"
+    return f"Stock of good #{id} was spread over {shards} shards"
+
+# both read the sales_daily rollup, which lags checkouts by up to a minute
+@router_good.get('/analytics/daily', response_model=list[SalesDay])
+async def sales_daily(
+    good_id: Optional[int] = None,
+    days: tuple[date, date] = Depends(sales_range),
+    user = Depends(fastapi_users.current_user()),
+    session: AsyncSession = Depends(get_async_session)
+) -> list[SalesDay]:
+    
+    if user.role != RoleType.seller:
+        raise HTTPException(
+            status_code=491,
+            detail=f"Operations with goods only for sellers!"
+        )
+
+    query = \
+        select(
+            SalesDaily.day,
+            func.sum(SalesDaily.quantity).label('quantity'),
+            func.sum(SalesDaily.revenue).label('revenue'),
+            func.sum(SalesDaily.orders).label('orders')
+        ).filter(
+            SalesDaily.seller_id == user.id,
+            SalesDaily.day.between(*days)
+        ).group_by(
+            SalesDaily.day
+        ).order_by(
+            SalesDaily.day
+        )
+    if good_id is not None:
+        query = query.filter(SalesDaily.good_id == good_id)
+
+    result = (await session.execute(query)).all()
+
+    return [
+        SalesDay(
+            day=item.day,
+            quantity=item.quantity,
+            revenue=item.revenue,
+            orders=item.orders
+        )
+        for item in result
+    ]
+
+@router_good.get('/analytics/goods', response_model=list[SalesGood])
+async def sales_goods(
+    days: tuple[date, date] = Depends(sales_range),
+    limit: int = Depends(page_limit),
+    user = Depends(fastapi_users.current_user()),
+    session: AsyncSession = Depends(get_async_session)
+) -> list[SalesGood]:
+    
+    if user.role != RoleType.seller:
+        raise HTTPException(
+            status_code=491,
+            detail=f"Operations with goods only for sellers!"
+        )
+
+    # the best sellers of the range by revenue
+    totals = \
+        select(
+            SalesDaily.good_id,
+            func.sum(SalesDaily.quantity).label('quantity'),
+            func.sum(SalesDaily.revenue).label('revenue'),
+            func.sum(SalesDaily.orders).label('orders')
+        ).filter(
+            SalesDaily.seller_id == user.id,
+            SalesDaily.day.between(*days)
+        ).group_by(
+            SalesDaily.good_id
+        ).subquery('totals')
+
+    query = \
+        select(
+            totals.c.good_id,
+            Good.product_name.label('good_name'),
+            totals.c.quantity,
+            totals.c.revenue,
+            totals.c.orders
+        ).join(
+            Good, Good.id == totals.c.good_id
+        ).order_by(
+            totals.c.revenue.desc(),
+            totals.c.good_id
+        ).limit(
+            limit
+        )
+
+    result = (await session.execute(query)).all()
+
+    return [
+        SalesGood(
+            good_id=item.good_id,
+            good_name=item.good_name,
+            quantity=item.quantity,
+            revenue=item.revenue,
+            orders=item.orders
+        )
+        for item in result
+    ]
 
 @router_good.delete('/delete', response_model=Optional[str])
 async def delete_good(
@@ -269,23 +831,27 @@ async def delete_good(
 ) -> Union[str, HTTPException]:
     
     try:
-        query = \
-            select(
-                Good.product_name
-            ).filter(
-                Good.id == good_id
-            )
-
         stmt = \
             delete(
                 Good
             ).filter(
                 Good.id == good_id
+            ).returning(
+                Good.product_name,
+                Good.seller_id,
+                Good.category_id,
+                Good.unit_price
             )
         
-        name = (await session.execute(query)).first()
-        await session.execute(stmt)
+        name = (await session.execute(stmt)).first()
+        if name:
+            await replace_prices(
+                session, removed=[(name.category_id, name.unit_price)]
+            )
+            await notify_catalog(session, [good_id])
         await session.commit()
+        if name:
+            await bump_versions(name.seller_id)
         
         return f"Good '{name.product_name}' was deleted with market"
     except Exception as error:
@@ -300,6 +866,10 @@ async def add_orders(
     # count_list: list[int],
     # country: str,
     data: AddOrder,
+    response: Response,
+    idempotency_key: Optional[str] = Header(
+        default=None, alias='Idempotency-Key', max_length=255
+    ),
     session: AsyncSession = Depends(get_async_session),
     user = Depends(fastapi_users.current_user())
 ) -> Union[str, HTTPException]:
@@ -314,44 +884,87 @@ async def add_orders(
             detail=f"Customers is not verified!"
         )
 
-    user_id = user.id
-    stmt = insert(Order).values(
-        customer_id=user_id,
-        ship_country=country
-    )
-    query = \
-        select(
-            Good.unit_price
-        ).filter(
-            Good.id.in_(product_list)
-        )
-    
-    ord_id = (await session.execute(stmt)).inserted_primary_key[0]
-    await session.commit()
-    prices = (await session.execute(query)).scalars().all()
+    async def place() -> dict:
+        # in intake mode the order is only checked and queued; it is
+        # written in batches by tasks.order_intake, which sends the emails
+        if setting.ORDER_INTAKE:
+            try:
+                check_order(product_list, count_list)
+            except ValueError as error:
+                raise HTTPException(
+                    status_code=488,
+                    detail=str(error)
+                )
+            try:
+                token = await enqueue_order(
+                    OrderRequest(user.id, country, product_list, count_list),
+                    user.email
+                )
+                return {'token': token, 'response': token}
+            except RedisError as error:
+                logger.warning(f"Order intake is unavailable: {error}")
 
-    data = [
-        {
-            "order_id": ord_id,
-            "good_id": product_list[item],
-            "quantity": count_list[item],
-            "price": prices[item] * count_list[item]
+        # the writer groups concurrent checkouts into one commit
+        try:
+            if setting.ORDER_WRITER:
+                ord_id = await order_writer.submit(
+                    OrderRequest(user.id, country, product_list, count_list)
+                )
+            else:
+                ord_id = await place_order(
+                    session, user.id, country, product_list, count_list
+                )
+                await session.commit()
+        except OrderWriterDown as error:
+            raise HTTPException(
+                status_code=503,
+                detail=str(error)
+            )
+        except asyncio.TimeoutError:
+            raise HTTPException(
+                status_code=504,
+                detail=f"Order was not written in time"
+            )
+        except ValueError as error:
+            raise HTTPException(
+                status_code=488,
+                detail=str(error)
+            )
+        except LookupError as error:
+            await session.rollback()
+            raise HTTPException(
+                status_code=489,
+                detail=str(error)
+            )
+        except OutOfStock as error:
+            await session.rollback()
+            raise HTTPException(
+                status_code=409,
+                detail=str(error)
+            )
+
+        return {
+            'order_id': ord_id,
+            'response': f"Ur order was created. U get a message with details of order"
         }
-        for item in range(len(prices)) 
-    ]
 
-    stmt = \
-        insert(
-            OrderDetail
-        ).values(
-            data
+    # a retried checkout replays the stored answer instead of ordering again;
+    # place() ends with the commit, so a failure inside it frees the key
+    replayed = False
+    if idempotency_key is None:
+        record = await place()
+    else:
+        record, replayed = await run_once(
+            f'order:{user.id}:{idempotency_key}', place
         )
-    
-    await session.execute(stmt)
-    await session.commit()
+        if replayed:
+            response.headers['Idempotent-Replayed'] = 'true'
 
-    items_list = []
-    for item in data:
+    if 'token' in record:
+        response.status_code = 202
+        response.headers['Location'] = f"/orders/status/{record['token']}"
+    elif not replayed:
+        # one set-based read, however many lines the order has
         query = \
             select(
                 User.email,
@@ -362,113 +975,156 @@ async def add_orders(
             ).join(
                 User, User.id == Good.seller_id
             ).filter(
-                Good.id == item['good_id']
+                OrderDetail.order_id == record['order_id']
             )
         
-        items_list.append((await session.execute(query)).first())
-    
-    email_query = \
-        select(
-            User.email
-        ).filter(
-            User.id == user_id
-        )
-    
-    customer_email = (await session.execute(email_query)).first()
+        items_list = (await session.execute(query)).all()
+
+        seller_order(items_list)
+        customer_order(items_list, user.email)
+
+    return record['response']
+
+@router_order.get('/status/{token}', response_model=OrderStatus)
+async def get_order_status(
+    token: str,
+    user = Depends(fastapi_users.current_user())
+) -> OrderStatus:
 
-    seller_order(items_list)
-    customer_order(items_list, customer_email.email)
+    status = await order_status(token)
+    if not status or status['customer_id'] != user.id:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Order token not found"
+        )
 
-    return f"Ur order was created. U get a message with details of order"
+    return OrderStatus(
+        token=token,
+        status=status['status'],
+        order_id=status.get('order_id'),
+        detail=status.get('detail')
+    )
 
 @router_order.delete('/delete', response_model=Optional[str])
 async def delete_order(
     id: int,
+    date_order: Optional[datetime] = None,
     session: AsyncSession = Depends(get_async_session)
 ) -> Union[str, HTTPException]:
 
+    # the lock keeps the sales rollup from counting the order meanwhile;
+    # with date_order given only one month partition is searched
     query = \
         select(
-            Order
+            Order.date_order,
+            Order.rolled_up
         ).filter(
             Order.id == id
-        )
+        ).with_for_update()
+    if date_order is not None:
+        query = query.filter(Order.date_order == date_order)
     temp = (await session.execute(query)).first()
     if not temp:
         raise HTTPException(
             status_code=487,
             detail=f"Order with this number doesnt exist"
         )
+    if temp.rolled_up:
+        await session.execute(unroll_statement(id, temp.date_order))
 
     stmt = \
         delete(
             Order
         ).filter(
-            Order.id == id
+            Order.id == id,
+            Order.date_order == temp.date_order
         )
 
+    await release_stock(session, id, temp.date_order)
     await session.execute(stmt)
     await session.commit()
 
     return f"Order #{id} was deleted"
 
-@router_order.get('/my_orders',response_model=Optional[list[MyOrder]])
+@router_order.get('/my_orders', response_model=MyOrderPage)
 async def get_orders(
+    cursor: Optional[str] = None,
+    limit: int = Depends(page_limit),
     user = Depends(fastapi_users.current_user()),
     session: AsyncSession = Depends(get_async_session)
-) -> Union[MyOrder, HTTPException]:
+) -> MyOrderPage:
     user_id = user.id
 
+    # lines are folded per order by the database, and only for the
+    # orders of this page
+    lines = \
+        select(
+            func.json_agg(
+                aggregate_order_by(
+                    func.json_build_object(
+                        'good_id', OrderDetail.good_id,
+                        'good_name', Good.product_name,
+                        'quantity', OrderDetail.quantity,
+                        'price', OrderDetail.price
+                    ),
+                    OrderDetail.good_id
+                ),
+                type_=JSON
+            )
+        ).join(
+            Good, Good.id == OrderDetail.good_id
+        ).filter(
+            OrderDetail.order_id == Order.id,
+            OrderDetail.date_order == Order.date_order
+        ).scalar_subquery()
+
     query = \
         select(
             Order.id,
-            Good.product_name,
-            Good.unit_price,
-            OrderDetail.quantity,
-            Order.ship_country
-        ).join(
-            OrderDetail, OrderDetail.good_id == Good.id
-        ).join(
-            Order, Order.id == OrderDetail.order_id
+            Order.date_order,
+            Order.ship_country,
+            Order.total_amount,
+            Order.item_count,
+            lines.label('lines')
         ).filter(
             Order.customer_id == user_id
-        ).group_by(
-            Order.id,
-            Good.product_name,
-            Good.unit_price,
-            OrderDetail.quantity,
-            Order.ship_country
+        ).order_by(
+            Order.date_order.desc(),
+            Order.id.desc()
+        ).limit(
+            limit + 1
+        )
+
+    # newest first, keyset on (date_order, id); the plain bound on
+    # date_order lets the planner skip the months after the cursor
+    last = decode_cursor(cursor, 2)
+    if last:
+        last_date = decode_time(last[0])
+        query = query.filter(
+            Order.date_order <= last_date,
+            tuple_(Order.date_order, Order.id) < tuple_(last_date, last[1])
         )
     
-    result = (await session.execute(query)).all()
-    if not result:
+    temp = (await session.execute(query)).all()
+    if not temp:
         raise HTTPException(
             status_code=404,
             detail=f"Orders not found"
         )
 
-    data = {}
-    list_orders = []
-
-    for item in result:
-        if item.id not in data:
-            data[item.id] = []
-        data[item.id].append((
-            item.product_name, item.unit_price, item.quantity, item.ship_country
-        ))
-    for numb, temp in data.items():
-        obj = "| ".join([f"|Good: {good}, price: {price}, "\
-                         f"count: {count}, country: {country}" \
-                         for good, price, count, country in temp])
-        list_orders.append((numb, str(obj)))
-    
     result = [
         MyOrder(
-            id=item[0],
-            description=item[1]
+            id=item.id,
+            date_order=item.date_order,
+            ship_country=item.ship_country,
+            total_amount=item.total_amount,
+            item_count=item.item_count,
+            lines=item.lines or []
         )
-        for item in list_orders
+        for item in temp[:limit]
     ]
+    next_cursor = encode_cursor(
+        encode_time(temp[limit - 1].date_order), temp[limit - 1].id
+    ) if len(temp) > limit else None
 
-    return result
-
+    return MyOrderPage(items=result, next_cursor=next_cursor)
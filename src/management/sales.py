@@ -0,0 +1,120 @@
+from datetime import date, datetime, timedelta, timezone
+from typing import Optional
+
+from fastapi import HTTPException
+from sqlalchemy import Date, Select, Update, cast, func, select, tuple_, update
+from sqlalchemy.dialects.postgresql import insert
+
+from management.models import Good, Order, OrderDetail, SalesDaily
+from config import setting
+
+
+def sales_range(
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None
+) -> tuple[date, date]:
+    # both ends are included; the default is the last SALES_RANGE_DAYS days
+    date_to = date_to or datetime.now(timezone.utc).date()
+    date_from = date_from or date_to - timedelta(days=setting.SALES_RANGE_DAYS - 1)
+    if date_from > date_to:
+        raise HTTPException(
+            status_code=400,
+            detail=f"date_from is after date_to"
+        )
+    return date_from, date_to
+
+def sale_day(column):
+    # days are counted in UTC, whatever the session time zone
+    return cast(func.timezone('UTC', column), Date)
+
+def rollup_statement(batch: int) -> Select:
+    # claiming the orders and adding their lines happen in one statement,
+    # so an order is counted exactly once; orders locked by a delete are
+    # skipped and left for the next run
+    pending = \
+        select(
+            Order.id,
+            Order.date_order
+        ).filter(
+            Order.rolled_up.is_(False)
+        ).order_by(
+            Order.id
+        ).limit(
+            batch
+        ).with_for_update(
+            skip_locked=True
+        )
+
+    claimed = \
+        update(
+            Order
+        ).filter(
+            tuple_(Order.id, Order.date_order).in_(pending)
+        ).values(
+            rolled_up=True
+        ).returning(
+            Order.id,
+            Order.date_order
+        ).cte('claimed')
+
+    lines = \
+        select(
+            Good.seller_id,
+            sale_day(claimed.c.date_order).label('day'),
+            OrderDetail.good_id,
+            func.sum(OrderDetail.quantity).label('quantity'),
+            func.sum(OrderDetail.price).label('revenue'),
+            func.count().label('orders')
+        ).join(
+            OrderDetail,
+            (OrderDetail.order_id == claimed.c.id)
+            & (OrderDetail.date_order == claimed.c.date_order)
+        ).join(
+            Good, Good.id == OrderDetail.good_id
+        ).group_by(
+            Good.seller_id,
+            sale_day(claimed.c.date_order),
+            OrderDetail.good_id
+        )
+
+    upsert = insert(SalesDaily).from_select(
+        ['seller_id', 'day', 'good_id', 'quantity', 'revenue', 'orders'],
+        lines
+    )
+    upsert = upsert.on_conflict_do_update(
+        index_elements=['seller_id', 'day', 'good_id'],
+        set_={
+            'quantity': SalesDaily.quantity + upsert.excluded.quantity,
+            'revenue': SalesDaily.revenue + upsert.excluded.revenue,
+            'orders': SalesDaily.orders + upsert.excluded.orders
+        }
+    ).returning(
+        SalesDaily.good_id
+    ).cte('upserted')
+
+    return \
+        select(
+            func.count()
+        ).select_from(
+            claimed
+        ).add_cte(
+            upsert
+        )
+
+def unroll_statement(order_id: int, date_order: datetime) -> Update:
+    # only for an order that is already counted and locked by the caller
+    return \
+        update(
+            SalesDaily
+        ).filter(
+            SalesDaily.seller_id == Good.seller_id,
+            SalesDaily.good_id == OrderDetail.good_id,
+            SalesDaily.day == sale_day(OrderDetail.date_order),
+            Good.id == OrderDetail.good_id,
+            OrderDetail.order_id == order_id,
+            OrderDetail.date_order == date_order
+        ).values(
+            quantity=SalesDaily.quantity - OrderDetail.quantity,
+            revenue=SalesDaily.revenue - OrderDetail.price,
+            orders=SalesDaily.orders - 1
+        )
@@ -1,3 +1,6 @@
+from datetime import date, datetime
+from typing import Optional
+
 from pydantic import BaseModel
 
 from management.models import CategoryType
@@ -16,9 +19,97 @@ class GoodSeller(BaseModel):
     good_price: float
 
 
+class MyGoodPage(BaseModel):
+    items: list[AddGood]
+    next_cursor: Optional[str] = None
+
+
+class CategoryFacet(BaseModel):
+    category: CategoryType
+    good_count: int
+
+
+class PriceBucket(BaseModel):
+    min_price: float
+    max_price: Optional[float]
+    good_count: int
+
+
+class Facets(BaseModel):
+    categories: list[CategoryFacet]
+    prices: list[PriceBucket]
+
+
+class GoodPage(BaseModel):
+    items: list[GoodSeller]
+    next_cursor: Optional[str] = None
+    facets: Optional[Facets] = None
+
+
+class PriceChange(BaseModel):
+    good_id: int
+    price: float
+
+
+class BulkError(BaseModel):
+    row: int
+    error: str
+
+
+class BulkResult(BaseModel):
+    inserted: int
+    errors: list[BulkError]
+
+
+class CategoryStats(BaseModel):
+    category: CategoryType
+    good_count: int
+    min_price: Optional[float]
+    max_price: Optional[float]
+    avg_price: Optional[float]
+
+
+class OrderLine(BaseModel):
+    good_id: int
+    good_name: str
+    quantity: int
+    price: float
+
+
 class MyOrder(BaseModel):
     id: int
-    description: str
+    date_order: datetime
+    ship_country: str
+    total_amount: float
+    item_count: int
+    lines: list[OrderLine]
+
+
+class MyOrderPage(BaseModel):
+    items: list[MyOrder]
+    next_cursor: Optional[str] = None
+
+
+class SalesDay(BaseModel):
+    day: date
+    quantity: int
+    revenue: float
+    orders: int
+
+
+class SalesGood(BaseModel):
+    good_id: int
+    good_name: str
+    quantity: int
+    revenue: float
+    orders: int
+
+
+class OrderStatus(BaseModel):
+    token: str
+    status: str
+    order_id: Optional[int] = None
+    detail: Optional[str] = None
 
 
 class AddOrder(BaseModel):
@@ -0,0 +1,362 @@
+import asyncio
+import fcntl
+import json
+import logging
+import mmap
+import os
+from typing import Iterable, Optional, Union
+
+import asyncpg
+import numpy as np
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import setting
+from management.registry import registry
+from management.schemas import GoodPage, GoodSeller
+from management.pagination import decode_cursor, encode_cursor
+
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'catalog_changes'
+NOTIFY_MAX_IDS = 500
+
+MAGIC = b'ECSNAP01'
+ALIGN = 64
+SCAN_CHUNK = 65536
+
+DEBOUNCE = 0.05
+RETRY = 5
+
+GOODS_SQL = (
+    'SELECT g.id, g.seller_id, g.category_id, g.unit_price, '
+    'g.product_name, u.username '
+    'FROM good g JOIN "user" u ON u.id = g.seller_id'
+)
+
+
+async def notify_catalog(
+    session: AsyncSession,
+    ids: Optional[Iterable[int]] = None
+) -> None:
+    # delivered on commit; big or unknown change sets ask for a reload
+    if not setting.CATALOG_SNAPSHOT:
+        return
+
+    ids = None if ids is None else sorted(set(ids))
+    if ids is None or len(ids) > NOTIFY_MAX_IDS:
+        payload = {'reload': True}
+    else:
+        payload = {'ids': ids}
+
+    await session.execute(select(func.pg_notify(CHANNEL, json.dumps(payload))))
+
+
+def write_snapshot(path: str, arrays: dict[str, np.ndarray]) -> None:
+    header = {}
+    offset = 0
+    for name, array in arrays.items():
+        header[name] = [offset, array.dtype.str, len(array)]
+        offset += -(-array.nbytes // ALIGN) * ALIGN
+
+    raw = json.dumps(header).encode()
+    start = -(-(len(MAGIC) + 8 + len(raw)) // ALIGN) * ALIGN
+
+    # readers keep the old file mapped until they see the new inode
+    temp = f'{path}.{os.getpid()}.tmp'
+    with open(temp, 'wb') as file:
+        file.write(MAGIC)
+        file.write(len(raw).to_bytes(8, 'little'))
+        file.write(raw)
+        for name, array in arrays.items():
+            file.seek(start + header[name][0])
+            file.write(np.ascontiguousarray(array).tobytes())
+        file.truncate(start + offset)
+    os.replace(temp, path)
+
+def decode_event(payload: str) -> dict:
+    # a payload that cannot be read asks for a reload
+    try:
+        event = json.loads(payload)
+        if event.get('reload') or all(isinstance(item, int) for item in event['ids']):
+            return event
+    except (AttributeError, KeyError, TypeError, ValueError):
+        pass
+    logger.warning(f"Unexpected catalog change payload: {payload[:200]}")
+    return {'reload': True}
+
+
+class SnapshotBuilder:
+
+    def __init__(self) -> None:
+        # the columns are kept sorted by (unit_price, id), the order the
+        # snapshot is searched in
+        self.ids = np.empty(0, dtype=np.int64)
+        self.seller_ids = np.empty(0, dtype=np.int64)
+        self.category_ids = np.empty(0, dtype=np.int32)
+        self.prices = np.empty(0, dtype=np.float64)
+        self.names = np.empty(0, dtype=object)
+        self.name_lengths = np.empty(0, dtype=np.int64)
+        self.sellers: dict[int, bytes] = {}
+
+    @property
+    def _data(self) -> tuple:
+        return (self.ids, self.seller_ids, self.category_ids, self.prices,
+                self.names, self.name_lengths)
+
+    @_data.setter
+    def _data(self, columns: Iterable[np.ndarray]) -> None:
+        (self.ids, self.seller_ids, self.category_ids, self.prices,
+         self.names, self.name_lengths) = columns
+
+    def _columns(self, rows: list) -> list[np.ndarray]:
+        for item in rows:
+            self.sellers[item[1]] = item[5].encode()
+        names = [item[4].encode() for item in rows]
+        columns = (
+            np.array([item[0] for item in rows], dtype=np.int64),
+            np.array([item[1] for item in rows], dtype=np.int64),
+            np.array([item[2] for item in rows], dtype=np.int32),
+            np.array([item[3] for item in rows], dtype=np.float64),
+            np.array(names, dtype=object),
+            np.fromiter((len(item) for item in names), dtype=np.int64, count=len(names))
+        )
+        order = np.lexsort((columns[0], columns[3]))
+        return [column[order] for column in columns]
+
+    def replace(self, rows: list) -> None:
+        self.sellers = {}
+        self._data = self._columns(rows)
+
+    def update(self, ids: Iterable[int], rows: list) -> None:
+        # changed ids are dropped, rows that still exist come back fresh and
+        # are merged into the sorted columns at their (unit_price, id) place
+        keep = ~np.isin(self.ids, np.fromiter(ids, dtype=np.int64))
+        current = [column[keep] for column in self._data]
+        fresh = self._columns(rows)
+
+        prices, present = current[3], current[0]
+        low = np.searchsorted(prices, fresh[3], 'left')
+        high = np.searchsorted(prices, fresh[3], 'right')
+        positions = [
+            start + int(np.searchsorted(present[start:end], numb))
+            for start, end, numb in zip(low.tolist(), high.tolist(), fresh[0].tolist())
+        ]
+        self._data = [
+            np.insert(column, np.array(positions, dtype=np.int64), added)
+            for column, added in zip(current, fresh)
+        ]
+
+    def arrays(self) -> dict[str, np.ndarray]:
+        sellers = np.array(sorted(self.sellers), dtype=np.int64)
+        seller_names = [self.sellers[item] for item in sellers.tolist()]
+        seller_lengths = np.fromiter(
+            (len(item) for item in seller_names), dtype=np.int64, count=len(seller_names)
+        )
+
+        return {
+            'ids': self.ids,
+            'seller_ids': self.seller_ids,
+            'category_ids': self.category_ids,
+            'prices': self.prices,
+            'name_offsets': np.concatenate(([0], np.cumsum(self.name_lengths))).astype(np.int64),
+            'names': np.frombuffer(b''.join(self.names), dtype=np.uint8),
+            'sellers': sellers,
+            'seller_offsets': np.concatenate(([0], np.cumsum(seller_lengths))).astype(np.int64),
+            'seller_names': np.frombuffer(b''.join(seller_names), dtype=np.uint8)
+        }
+
+    def publish(self, path: str) -> None:
+        write_snapshot(path, self.arrays())
+
+
+class CatalogSnapshot:
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._inode = None
+        self._arrays = None
+        self._task = None
+
+    def _view(self) -> Optional[dict[str, np.ndarray]]:
+        try:
+            inode = os.stat(self.path).st_ino
+        except FileNotFoundError:
+            return None
+        if inode == self._inode:
+            return self._arrays
+
+        with open(self.path, 'rb') as file:
+            buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if buffer[:len(MAGIC)] != MAGIC:
+            return None
+        size = int.from_bytes(buffer[len(MAGIC):len(MAGIC) + 8], 'little')
+        header = json.loads(buffer[len(MAGIC) + 8:len(MAGIC) + 8 + size])
+        start = -(-(len(MAGIC) + 8 + size) // ALIGN) * ALIGN
+
+        # the old mapping is released once no array refers to it
+        self._arrays = {
+            name: np.frombuffer(buffer, dtype=dtype, count=count, offset=start + offset)
+            if count else np.empty(0, dtype=dtype)
+            for name, (offset, dtype, count) in header.items()
+        }
+        self._inode = inode
+        return self._arrays
+
+    @property
+    def ready(self) -> bool:
+        return self._view() is not None
+
+    def search(
+        self,
+        category_id: Optional[int],
+        min_price: Optional[float],
+        max_price: Optional[float],
+        last: Optional[list],
+        limit: int
+    ) -> Optional[list[tuple]]:
+
+        arrays = self._view()
+        if arrays is None:
+            return None
+        ids = arrays['ids']
+        prices = arrays['prices']
+        category_ids = arrays['category_ids']
+
+        low = 0 if min_price is None else \
+            int(np.searchsorted(prices, min_price, 'left'))
+        high = len(prices) if max_price is None else \
+            int(np.searchsorted(prices, max_price, 'right'))
+        if last:
+            # (unit_price, id) keyset: ids are sorted inside one price
+            first = int(np.searchsorted(prices, last[0], 'left'))
+            end = int(np.searchsorted(prices, last[0], 'right'))
+            low = max(low, first + int(np.searchsorted(ids[first:end], last[1], 'right')))
+
+        found = []
+        position = low
+        while position < high and len(found) <= limit:
+            end = min(position + SCAN_CHUNK, high)
+            if category_id is None:
+                index = np.arange(position, end)
+            else:
+                index = np.flatnonzero(category_ids[position:end] == category_id) + position
+            found.extend(index[:limit + 1 - len(found)].tolist())
+            position = end
+
+        return [self._row(arrays, item) for item in found]
+
+    @staticmethod
+    def _row(arrays: dict[str, np.ndarray], item: int) -> tuple:
+        offsets = arrays['name_offsets']
+        name = arrays['names'][offsets[item]:offsets[item + 1]].tobytes().decode()
+
+        seller = int(np.searchsorted(arrays['sellers'], arrays['seller_ids'][item]))
+        seller_offsets = arrays['seller_offsets']
+        seller_name = arrays['seller_names'][
+            seller_offsets[seller]:seller_offsets[seller + 1]
+        ].tobytes().decode()
+
+        return (
+            int(arrays['ids'][item]),
+            name,
+            seller_name,
+            int(arrays['category_ids'][item]),
+            float(arrays['prices'][item])
+        )
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._maintain())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    async def _maintain(self) -> None:
+        # one worker per host holds the lock and rebuilds the shared file,
+        # the others only map it and take over if the holder goes away
+        with open(f'{self.path}.lock', 'w') as lock:
+            while True:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    await asyncio.sleep(RETRY)
+                    continue
+
+                try:
+                    await self._listen()
+                except Exception as error:
+                    # whatever ends the listener, the file must not go stale
+                    logger.error(f"Catalog snapshot listener failed: {error}")
+                finally:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+                await asyncio.sleep(RETRY)
+
+    async def _listen(self) -> None:
+        dsn = setting.DB_URL.replace('postgresql+asyncpg://', 'postgresql://')
+        conn = await asyncpg.connect(dsn)
+        events = asyncio.Queue()
+        try:
+            await conn.add_listener(
+                CHANNEL, lambda *args: events.put_nowait(decode_event(args[3]))
+            )
+            builder = SnapshotBuilder()
+            builder.replace(await conn.fetch(GOODS_SQL))
+            builder.publish(self.path)
+
+            while True:
+                batch = [await events.get()]
+                await asyncio.sleep(DEBOUNCE)
+                while not events.empty():
+                    batch.append(events.get_nowait())
+
+                if any(item.get('reload') for item in batch):
+                    builder.replace(await conn.fetch(GOODS_SQL))
+                else:
+                    ids = {numb for item in batch for numb in item['ids']}
+                    rows = await conn.fetch(
+                        f'{GOODS_SQL} WHERE g.id = ANY($1::int[])', list(ids)
+                    )
+                    builder.update(ids, rows)
+                builder.publish(self.path)
+        finally:
+            await conn.close()
+
+
+catalog_snapshot = CatalogSnapshot(setting.CATALOG_SNAPSHOT_PATH)
+
+
+async def search_page(
+    category_id: Optional[int],
+    min_price: Optional[float],
+    max_price: Optional[float],
+    cursor: Optional[str],
+    limit: int,
+    session: AsyncSession
+) -> Union[GoodPage, str, None]:
+
+    rows = catalog_snapshot.search(
+        category_id, min_price, max_price, decode_cursor(cursor, 2), limit
+    )
+    if rows is None:
+        return None
+    if not rows:
+        return f"Goods to params are not found"
+
+    names = await registry.get_names(session)
+    result = [
+        GoodSeller(
+            seller_name=seller_name,
+            good_name=good_name,
+            good_category=names[category_id],
+            good_price=price
+        )
+        for _, good_name, seller_name, category_id, price in rows[:limit]
+    ]
+    next_cursor = encode_cursor(
+        rows[limit - 1][4], rows[limit - 1][0]
+    ) if len(rows) > limit else None
+
+    return GoodPage(items=result, next_cursor=next_cursor)
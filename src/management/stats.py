@@ -0,0 +1,155 @@
+from typing import Iterable, Optional, Sequence
+
+from sqlalchemy import Float, FromClause, Integer, case, column, func, \
+                       select, update, values
+from sqlalchemy.dialects.postgresql import Insert, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from management.models import CategoryPriceStats, Category, Good
+
+
+# asyncpg caps a statement at 32767 parameters
+STATS_BATCH_SIZE = 10000
+
+# each category has a single stats row, so goods writes in one category
+# serialize on its lock until they commit; callers update the stats last,
+# right before the commit, to keep that window short
+
+def price_rows(rows: Iterable[tuple[int, float]]) -> FromClause:
+    return \
+        values(
+            column('category_id', Integer),
+            column('unit_price', Float),
+            name='prices'
+        ).data(
+            list(rows)
+        )
+
+def aggregate(source: FromClause):
+    return \
+        select(
+            source.c.category_id,
+            func.count().label('good_count'),
+            func.sum(source.c.unit_price).label('price_sum'),
+            func.min(source.c.unit_price).label('min_price'),
+            func.max(source.c.unit_price).label('max_price')
+        ).group_by(
+            source.c.category_id
+        )
+
+async def add_prices(session: AsyncSession, source: FromClause) -> None:
+    stmt = \
+        insert(
+            CategoryPriceStats
+        ).from_select(
+            ['category_id', 'good_count', 'price_sum', 'min_price', 'max_price'],
+            aggregate(source)
+        )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[CategoryPriceStats.category_id],
+        set_={
+            'good_count': CategoryPriceStats.good_count + stmt.excluded.good_count,
+            'price_sum': CategoryPriceStats.price_sum + stmt.excluded.price_sum,
+            'min_price': func.least(
+                CategoryPriceStats.min_price, stmt.excluded.min_price
+            ),
+            'max_price': func.greatest(
+                CategoryPriceStats.max_price, stmt.excluded.max_price
+            )
+        }
+    )
+
+    await session.execute(stmt)
+
+async def remove_prices(session: AsyncSession, source: FromClause) -> None:
+    # run after the goods are gone: a removed bound is looked up again,
+    # which is an index probe on (category_id, unit_price)
+    removed = aggregate(source).subquery('removed')
+    min_now = \
+        select(
+            func.min(Good.unit_price)
+        ).filter(
+            Good.category_id == CategoryPriceStats.category_id
+        ).scalar_subquery()
+    max_now = \
+        select(
+            func.max(Good.unit_price)
+        ).filter(
+            Good.category_id == CategoryPriceStats.category_id
+        ).scalar_subquery()
+
+    stmt = \
+        update(
+            CategoryPriceStats
+        ).filter(
+            CategoryPriceStats.category_id == removed.c.category_id
+        ).values(
+            good_count=CategoryPriceStats.good_count - removed.c.good_count,
+            price_sum=CategoryPriceStats.price_sum - removed.c.price_sum,
+            min_price=case(
+                (removed.c.min_price <= CategoryPriceStats.min_price, min_now),
+                else_=CategoryPriceStats.min_price
+            ),
+            max_price=case(
+                (removed.c.max_price >= CategoryPriceStats.max_price, max_now),
+                else_=CategoryPriceStats.max_price
+            )
+        )
+
+    await session.execute(stmt)
+
+async def replace_prices(
+    session: AsyncSession,
+    removed: Sequence[tuple[int, float]] = (),
+    added: Sequence[tuple[int, float]] = ()
+) -> None:
+
+    for numb in range(0, len(removed), STATS_BATCH_SIZE):
+        await remove_prices(
+            session, price_rows(removed[numb:numb + STATS_BATCH_SIZE])
+        )
+    for numb in range(0, len(added), STATS_BATCH_SIZE):
+        await add_prices(
+            session, price_rows(added[numb:numb + STATS_BATCH_SIZE])
+        )
+
+def refresh_statement(category_ids: Optional[list[int]] = None) -> Insert:
+    query = \
+        select(
+            Category.id,
+            func.count(Good.id),
+            func.coalesce(func.sum(Good.unit_price), 0),
+            func.min(Good.unit_price),
+            func.max(Good.unit_price)
+        ).join(
+            Good, Good.category_id == Category.id, isouter=True
+        ).group_by(
+            Category.id
+        )
+    if category_ids is not None:
+        query = query.filter(Category.id.in_(category_ids))
+
+    stmt = \
+        insert(
+            CategoryPriceStats
+        ).from_select(
+            ['category_id', 'good_count', 'price_sum', 'min_price', 'max_price'],
+            query
+        )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[CategoryPriceStats.category_id],
+        set_={
+            'good_count': stmt.excluded.good_count,
+            'price_sum': stmt.excluded.price_sum,
+            'min_price': stmt.excluded.min_price,
+            'max_price': stmt.excluded.max_price
+        }
+    )
+
+    return stmt
+
+async def refresh_stats(
+    session: AsyncSession,
+    category_ids: Optional[list[int]] = None
+) -> None:
+    await session.execute(refresh_statement(category_ids))
@@ -0,0 +1,293 @@
+import random
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import Executable, Integer, case, delete, func, literal, \
+                       select, true, update
+from sqlalchemy.dialects.postgresql import ARRAY, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from management.models import Good, GoodStockShard, OrderDetail
+
+
+MAX_SHARDS = 64
+
+
+class OutOfStock(Exception):
+
+    def __init__(self, goods: list[int]) -> None:
+        self.goods = goods
+        super().__init__(f"Goods {goods} are out of stock")
+
+
+def good_lines(products: list[int], counts: list[int]):
+    lines = \
+        func.unnest(
+            literal(products, ARRAY(Integer)),
+            literal(counts, ARRAY(Integer))
+        ).table_valued(
+            'good_id', 'quantity'
+        ).render_derived(
+            name='lines'
+        )
+
+    return \
+        select(
+            lines.c.good_id,
+            func.sum(lines.c.quantity).label('quantity')
+        ).group_by(
+            lines.c.good_id
+        ).subquery('wanted')
+
+async def take_shards(
+    session: AsyncSession,
+    good_id: int,
+    quantity: int,
+    shards: int
+) -> bool:
+
+    # most buyers are served by one conditional update of a random shard
+    stmt = \
+        update(
+            GoodStockShard
+        ).filter(
+            GoodStockShard.good_id == good_id,
+            GoodStockShard.shard == random.randrange(shards),
+            GoodStockShard.stock >= quantity
+        ).values(
+            stock=GoodStockShard.stock - quantity
+        ).returning(
+            GoodStockShard.shard
+        )
+    if (await session.execute(stmt)).first():
+        return True
+
+    # otherwise the line is drawn across the shards in shard order, each
+    # with its own conditional decrement, so buyers lock shards in the
+    # order rebalance does; a short line is undone by the caller's
+    # rollback, like the rest of reserve_stock
+    query = \
+        select(
+            GoodStockShard.shard,
+            GoodStockShard.stock
+        ).filter(
+            GoodStockShard.good_id == good_id,
+            GoodStockShard.stock > 0
+        ).order_by(
+            GoodStockShard.shard
+        )
+
+    left = quantity
+    for shard, stock in (await session.execute(query)).all():
+        take = min(stock, left)
+        stmt = \
+            update(
+                GoodStockShard
+            ).filter(
+                GoodStockShard.good_id == good_id,
+                GoodStockShard.shard == shard,
+                GoodStockShard.stock >= take
+            ).values(
+                stock=GoodStockShard.stock - take
+            ).returning(
+                GoodStockShard.shard
+            )
+        if (await session.execute(stmt)).first():
+            left -= take
+            if not left:
+                return True
+    return False
+
+async def reserve_stock(
+    session: AsyncSession,
+    products: list[int],
+    counts: list[int]
+) -> list[int]:
+
+    # one conditional decrement for all lines and no FOR UPDATE: a buyer
+    # only waits on a row another buyer is decrementing right now, and the
+    # stock >= n check is re-evaluated on the row it gets
+    wanted = good_lines(products, counts)
+    reserved = \
+        update(
+            Good
+        ).filter(
+            Good.id == wanted.c.good_id,
+            Good.stock_shards == 0,
+            Good.stock >= wanted.c.quantity
+        ).values(
+            stock=Good.stock - wanted.c.quantity
+        ).returning(
+            Good.id
+        ).cte('reserved')
+
+    # tracked goods that were not decremented are short, hot goods are
+    # taken from their shards in good order, so two orders sharing hot
+    # goods lock their shards in the same order
+    query = \
+        select(
+            wanted.c.good_id,
+            wanted.c.quantity,
+            Good.stock_shards
+        ).join(
+            Good, Good.id == wanted.c.good_id
+        ).filter(
+            Good.stock.is_not(None),
+            wanted.c.good_id.not_in(select(reserved.c.id))
+        ).order_by(
+            wanted.c.good_id
+        )
+
+    short = []
+    for good_id, quantity, shards in (await session.execute(query)).all():
+        if not shards or not await take_shards(session, good_id, quantity, shards):
+            short.append(good_id)
+
+    return sorted(short)
+
+async def release_stock(
+    session: AsyncSession,
+    order_id: int,
+    date_order: datetime
+) -> None:
+
+    stmt = \
+        update(
+            Good
+        ).filter(
+            Good.id == OrderDetail.good_id,
+            OrderDetail.order_id == order_id,
+            OrderDetail.date_order == date_order,
+            Good.stock.is_not(None),
+            Good.stock_shards == 0
+        ).values(
+            stock=Good.stock + OrderDetail.quantity
+        )
+    await session.execute(stmt)
+
+    # units of a hot good go back through shard 0, rebalance spreads them
+    stmt = \
+        update(
+            GoodStockShard
+        ).filter(
+            GoodStockShard.good_id == OrderDetail.good_id,
+            OrderDetail.order_id == order_id,
+            OrderDetail.date_order == date_order,
+            Good.id == OrderDetail.good_id,
+            Good.stock_shards > 0,
+            GoodStockShard.shard == 0
+        ).values(
+            stock=GoodStockShard.stock + OrderDetail.quantity
+        )
+    await session.execute(stmt)
+
+def rebalance_statements(good_ids: Optional[list[int]] = None) -> list[Executable]:
+    # run in one transaction: shards of unmarked goods are folded back
+    # into good.stock, hot goods get exactly stock_shards rows with their
+    # whole stock spread evenly over them
+    def scope(column):
+        return column.in_(good_ids) if good_ids is not None else true()
+
+    create = \
+        insert(
+            GoodStockShard
+        ).from_select(
+            ['good_id', 'shard', 'stock'],
+            select(
+                Good.id,
+                func.generate_series(0, Good.stock_shards - 1),
+                literal(0)
+            ).filter(
+                Good.stock_shards > 0,
+                scope(Good.id)
+            )
+        ).on_conflict_do_nothing()
+
+    # buyers lock shards one at a time in (good_id, shard) order, the order
+    # this takes them in, so the two cannot deadlock
+    lock = \
+        select(
+            GoodStockShard.good_id
+        ).filter(
+            scope(GoodStockShard.good_id)
+        ).order_by(
+            GoodStockShard.good_id,
+            GoodStockShard.shard
+        ).with_for_update()
+
+    totals = \
+        select(
+            GoodStockShard.good_id,
+            func.sum(GoodStockShard.stock).label('total')
+        ).filter(
+            scope(GoodStockShard.good_id)
+        ).group_by(
+            GoodStockShard.good_id
+        ).subquery('totals')
+
+    fold = \
+        update(
+            Good
+        ).filter(
+            Good.id == totals.c.good_id,
+            Good.stock_shards == 0
+        ).values(
+            stock=func.coalesce(Good.stock, 0) + totals.c.total
+        )
+
+    spread_totals = \
+        select(
+            Good.id.label('good_id'),
+            Good.stock_shards,
+            (func.coalesce(Good.stock, 0) + totals.c.total).label('total')
+        ).join(
+            totals, totals.c.good_id == Good.id
+        ).filter(
+            Good.stock_shards > 0
+        ).subquery('spread')
+
+    spread = \
+        update(
+            GoodStockShard
+        ).filter(
+            GoodStockShard.good_id == spread_totals.c.good_id,
+            GoodStockShard.shard < spread_totals.c.stock_shards
+        ).values(
+            stock=spread_totals.c.total // spread_totals.c.stock_shards + case(
+                (
+                    GoodStockShard.shard < spread_totals.c.total % spread_totals.c.stock_shards,
+                    1
+                ),
+                else_=0
+            )
+        )
+
+    drain = \
+        update(
+            Good
+        ).filter(
+            Good.stock_shards > 0,
+            Good.stock > 0,
+            scope(Good.id)
+        ).values(
+            stock=0
+        )
+
+    prune = \
+        delete(
+            GoodStockShard
+        ).filter(
+            GoodStockShard.good_id == Good.id,
+            GoodStockShard.shard >= Good.stock_shards,
+            scope(GoodStockShard.good_id)
+        )
+
+    return [create, lock, fold, spread, drain, prune]
+
+async def rebalance(
+    session: AsyncSession,
+    good_ids: Optional[list[int]] = None
+) -> None:
+
+    for stmt in rebalance_statements(good_ids):
+        await session.execute(stmt)
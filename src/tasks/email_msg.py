@@ -1,16 +1,126 @@
+import logging
+import queue
 import smtplib
 from datetime import datetime
 
 from email.message import EmailMessage
 from celery import Celery
+from celery.schedules import crontab
+from celery.signals import worker_process_init, worker_process_shutdown
 
 from config import setting
 
 
 SMTP_HOST="smtp.gmail.com"
 SMTP_PORT=465
+SMTP_TIMEOUT=30
 
-celery = Celery('tasks', broker=f'redis://{setting.REDIS_HOST}:6379')
+logger = logging.getLogger(__name__)
+
+celery = Celery(
+    'tasks',
+    broker=f'redis://{setting.REDIS_HOST}:6379',
+    include=['tasks.partitions', 'tasks.stock', 'tasks.sales', 'tasks.stats']
+)
+celery.conf.beat_schedule = {
+    'maintain-order-partitions': {
+        'task': 'tasks.partitions.maintain_partitions',
+        'schedule': crontab(hour=3, minute=0)
+    },
+    'rebalance-stock-shards': {
+        'task': 'tasks.stock.rebalance_stock',
+        'schedule': 60.0
+    },
+    'roll-up-sales': {
+        'task': 'tasks.sales.roll_up_sales',
+        'schedule': 60.0
+    },
+    'refresh-price-stats': {
+        'task': 'tasks.stats.refresh_price_stats',
+        'schedule': crontab(minute='*/15')
+    }
+}
+
+
+class SmtpPool:
+
+    def __init__(self, size: int, max_messages: int) -> None:
+        self.size = size
+        self.max_messages = max_messages
+        self._idle = queue.LifoQueue()
+
+    def _connect(self) -> smtplib.SMTP_SSL:
+        server = smtplib.SMTP_SSL(SMTP_HOST, SMTP_PORT, timeout=SMTP_TIMEOUT)
+        server.login(setting.SMTP_USER, setting.SMTP_PASS)
+        return server
+
+    def _close(self, server: smtplib.SMTP_SSL) -> None:
+        try:
+            server.quit()
+        except (smtplib.SMTPException, OSError):
+            server.close()
+
+    def _acquire(self) -> tuple[smtplib.SMTP_SSL, int]:
+        # an idle connection is used only if the server still answers NOOP
+        while True:
+            try:
+                server, sent = self._idle.get_nowait()
+            except queue.Empty:
+                return self._connect(), 0
+            try:
+                if server.noop()[0] == 250:
+                    return server, sent
+            except (smtplib.SMTPException, OSError) as error:
+                logger.info(f"Dropping a stale SMTP connection: {error}")
+            self._close(server)
+
+    def _release(self, server: smtplib.SMTP_SSL, sent: int) -> None:
+        # rotated after max_messages, before the provider cuts it off
+        if sent >= self.max_messages or self._idle.qsize() >= self.size:
+            self._close(server)
+        else:
+            self._idle.put((server, sent))
+
+    def send(self, email: EmailMessage) -> None:
+        server, sent = self._acquire()
+        try:
+            try:
+                server.send_message(email)
+            except smtplib.SMTPServerDisconnected:
+                # dropped between NOOP and DATA, the message was not accepted
+                server.close()
+                server, sent = self._connect(), 0
+                server.send_message(email)
+        except (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused):
+            # the server refused this message, the connection is still good
+            self._release(server, sent + 1)
+            raise
+        except BaseException:
+            server.close()
+            raise
+        self._release(server, sent + 1)
+
+    def reset(self, close: bool = False) -> None:
+        # a forked child must not talk over the sockets of its parent
+        while True:
+            try:
+                server, _ = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            if close:
+                self._close(server)
+
+
+smtp_pool = SmtpPool(setting.SMTP_POOL_SIZE, setting.SMTP_POOL_MAX_MESSAGES)
+
+
+@worker_process_init.connect
+def open_smtp_pool(**kwargs) -> None:
+    smtp_pool.reset()
+
+@worker_process_shutdown.connect
+def close_smtp_pool(**kwargs) -> None:
+    smtp_pool.reset(close=True)
 
 @celery.task
 def send_email(email_content: str) -> None:
@@ -19,9 +129,7 @@ def send_email(email_content: str) -> None:
     email['From'] = email_content['From']
     email['To'] = email_content['To']
     email.set_content(email_content['Content'], subtype='html')
-    with smtplib.SMTP_SSL(SMTP_HOST, SMTP_PORT) as server:
-        server.login(setting.SMTP_USER, setting.SMTP_PASS)
-        server.send_message(email)
+    smtp_pool.send(email)
 
 def after_reg(user_email: str, user_name: str) -> None:
     email = {
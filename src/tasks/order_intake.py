@@ -0,0 +1,16 @@
+import asyncio
+import logging
+import os
+import socket
+
+from management.intake import order_intake
+
+
+async def main() -> None:
+    # several workers share the group, each under its own consumer name
+    await order_intake.run(f'{socket.gethostname()}-{os.getpid()}')
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
@@ -0,0 +1,100 @@
+import logging
+import re
+from datetime import date
+from typing import Optional
+
+from sqlalchemy import Connection, text
+from sqlalchemy.exc import DBAPIError
+
+from tasks.email_msg import celery
+from database import s_engine
+from config import setting
+
+
+logger = logging.getLogger(__name__)
+
+# referencing tables come first: a line partition is detached before its order
+PARTITIONED = ('order_detail', 'order')
+ARCHIVE_SCHEMA = 'archive'
+
+MONTH_SUFFIX = re.compile(r'_y(\d{4})m(\d{2})$')
+
+
+def add_months(month: date, shift: int) -> date:
+    numb = month.year * 12 + month.month - 1 + shift
+    return date(numb // 12, numb % 12 + 1, 1)
+
+def partition_name(table: str, month: date) -> str:
+    return f'{table}_y{month.year}m{month.month:02d}'
+
+def list_partitions(conn: Connection, table: str) -> dict[date, str]:
+    query = text(
+        "SELECT child.relname FROM pg_inherits "
+        "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+        "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+        "WHERE parent.relname = :table"
+    )
+    partitions = {}
+    for name in conn.execute(query, {'table': table}).scalars():
+        match = MONTH_SUFFIX.search(name)
+        if match:
+            partitions[date(int(match[1]), int(match[2]), 1)] = name
+    return partitions
+
+def create_partitions(conn: Connection, start: date, months: int) -> list[str]:
+    created = []
+    for table in reversed(PARTITIONED):
+        existing = list_partitions(conn, table)
+        for shift in range(months):
+            month = add_months(start, shift)
+            if month in existing:
+                continue
+            name = partition_name(table, month)
+            conn.execute(text(
+                f'CREATE TABLE IF NOT EXISTS "{name}" PARTITION OF "{table}" '
+                f"FOR VALUES FROM ('{month}') TO ('{add_months(month, 1)}')"
+            ))
+            created.append(name)
+    return created
+
+def archive_partitions(conn: Connection, before: date) -> list[str]:
+    # detached months keep their rows in the archive schema, without the
+    # foreign keys that tie them to live tables
+    conn.execute(text(f'CREATE SCHEMA IF NOT EXISTS "{ARCHIVE_SCHEMA}"'))
+    archived = []
+    for table in PARTITIONED:
+        for month, name in sorted(list_partitions(conn, table).items()):
+            if month >= before:
+                continue
+            conn.execute(text(f'ALTER TABLE "{table}" DETACH PARTITION "{name}"'))
+            keys = conn.execute(
+                text(
+                    "SELECT conname FROM pg_constraint "
+                    "WHERE conrelid = CAST(:name AS regclass) AND contype = 'f'"
+                ),
+                {'name': f'"{name}"'}
+            ).scalars().all()
+            for key in keys:
+                conn.execute(text(f'ALTER TABLE "{name}" DROP CONSTRAINT "{key}"'))
+            conn.execute(text(f'ALTER TABLE "{name}" SET SCHEMA "{ARCHIVE_SCHEMA}"'))
+            archived.append(name)
+    return archived
+
+@celery.task
+def maintain_partitions(today: Optional[str] = None) -> dict:
+    month = (date.fromisoformat(today) if today else date.today()).replace(day=1)
+    try:
+        with s_engine.begin() as conn:
+            created = create_partitions(
+                conn, month, setting.ORDER_PARTITIONS_AHEAD + 1
+            )
+        with s_engine.begin() as conn:
+            archived = archive_partitions(
+                conn, add_months(month, -setting.ORDER_RETAIN_MONTHS)
+            )
+    except DBAPIError as error:
+        # e.g. the default partition already holds rows of a new month
+        logger.error(f"Order partition maintenance failed: {error}")
+        raise
+
+    return {'created': created, 'archived': archived}
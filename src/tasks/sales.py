@@ -0,0 +1,31 @@
+import logging
+
+from sqlalchemy.exc import DBAPIError
+
+from tasks.email_msg import celery
+from database import s_engine
+from management.sales import rollup_statement
+from config import setting
+
+
+logger = logging.getLogger(__name__)
+
+
+@celery.task
+def roll_up_sales() -> int:
+    # each batch commits on its own, so a backlog drains in steps
+    total = 0
+    try:
+        while True:
+            with s_engine.begin() as conn:
+                claimed = conn.execute(
+                    rollup_statement(setting.SALES_ROLLUP_BATCH)
+                ).scalar()
+            total += claimed
+            if claimed < setting.SALES_ROLLUP_BATCH:
+                break
+    except DBAPIError as error:
+        logger.error(f"Sales rollup failed: {error}")
+        raise
+
+    return total
@@ -0,0 +1,22 @@
+import logging
+
+from sqlalchemy.exc import DBAPIError
+
+from tasks.email_msg import celery
+from database import s_engine
+from management.stats import refresh_statement
+
+
+logger = logging.getLogger(__name__)
+
+
+@celery.task
+def refresh_price_stats() -> None:
+    # concurrent removals of the current bounds can leave a stale min or
+    # max behind; this recomputes the table from good
+    try:
+        with s_engine.begin() as conn:
+            conn.execute(refresh_statement())
+    except DBAPIError as error:
+        logger.error(f"Price stats refresh failed: {error}")
+        raise
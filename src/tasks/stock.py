@@ -0,0 +1,22 @@
+import logging
+
+from sqlalchemy.exc import DBAPIError
+
+from tasks.email_msg import celery
+from database import s_engine
+from management.stock import rebalance_statements
+
+
+logger = logging.getLogger(__name__)
+
+
+@celery.task
+def rebalance_stock() -> None:
+    # refills dry shards of hot goods from the ones that still hold stock
+    try:
+        with s_engine.begin() as conn:
+            for stmt in rebalance_statements():
+                conn.execute(stmt)
+    except DBAPIError as error:
+        logger.error(f"Stock rebalance failed: {error}")
+        raise
@@ -1,6 +1,7 @@
 import asyncio
 import pytest
 
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from fastapi_users.jwt import generate_jwt
 from fastapi_users.db import SQLAlchemyUserDatabase
@@ -9,6 +10,8 @@ from unittest.mock import patch
 
 from database import get_async_session, Base
 from config import setting
+from cache import redis
+from tasks.email_msg import smtp_pool
 from auth.models import User
 from management.models import Category
 from auth.schemas import UserCreate
@@ -38,6 +41,7 @@ password = PasswordHelper()
 @pytest.fixture(scope="session", autouse=True)
 async def setup_db():
     assert setting.MODE == 'TEST'
+    await redis.flushdb()
     async with engine_db.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
     yield 
@@ -141,5 +145,29 @@ def fake_send():
 
 @pytest.fixture()
 def fake_smtp():
+    # pooled connections must not leak from one test into another
+    smtp_pool.reset()
     with patch('tasks.email_msg.smtplib.SMTP_SSL') as mocked_smtp:
-        yield mocked_smtp
\ No newline at end of file
+        mocked_smtp.return_value.noop.return_value = (250, b'2.0.0 OK')
+        yield mocked_smtp
+    smtp_pool.reset()
+
+@pytest.fixture()
+async def query_counter():
+    # cold cache, so every request reaches the database
+    await redis.flushdb()
+    statements = []
+
+    def _count(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(engine_test.sync_engine, 'before_cursor_execute', _count)
+    yield statements
+    event.remove(engine_test.sync_engine, 'before_cursor_execute', _count)
+
+async def explain(statement: str, parameters) -> str:
+    # tiny test tables are seq scanned unless the planner is pushed off it
+    async with engine_test.begin() as conn:
+        await conn.exec_driver_sql("SET LOCAL enable_seqscan = off")
+        plan = await conn.exec_driver_sql(f"EXPLAIN {statement}", parameters)
+        return "\n".join(plan.scalars().all())
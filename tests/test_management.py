@@ -1,9 +1,83 @@
+import asyncio
+import json
+import time
 import pytest
+from unittest.mock import patch
 
 from httpx import ASGITransport, AsyncClient
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.exc import DataError
 
 from main import app
 from management.schemas import AddGood
+from auth.models import User
+from management.models import Category, CategoryType, Good, GoodStockShard, \
+                              Order, OrderDetail
+from management.registry import registry
+from management.orders import OrderRequest, place_order, place_orders
+from management.stock import OutOfStock, rebalance, release_stock
+from management.stats import replace_prices
+from management.pagination import encode_cursor
+from management.facets import FACET_MAX_BUCKETS
+from management.order_writer import OrderWriter, OrderWriterDown
+from management.intake import OrderIntake, enqueue_order, order_status, \
+                              status_key
+import cache
+from cache import redis
+from tasks.sales import roll_up_sales
+from config import setting
+from conftest import session_user, explain, engine_test, AsyncSessionTest
+
+
+async def customer_id(email: str) -> int:
+    async for session in session_user():
+        query = \
+            select(
+                User.id
+            ).filter(
+                User.email == email
+            )
+        return (await session.execute(query)).scalar()
+
+async def seller_goods(seller_id: int) -> list[int]:
+    async for session in session_user():
+        query = \
+            select(
+                Good.id
+            ).filter(
+                Good.seller_id == seller_id
+            )
+        return (await session.execute(query)).scalars().all()
+
+async def new_goods(count: int, price: float = 10.0) -> list[int]:
+    # order tests sell goods of their own, whatever ran before them
+    seller_id = await customer_id('sellver@gmail.com')
+    async for session in session_user():
+        query = \
+            select(
+                Category.id
+            ).filter(
+                Category.category_name == CategoryType.games
+            )
+        category_id = (await session.execute(query)).scalar()
+        stmt = \
+            insert(
+                Good
+            ).values([
+                {
+                    'product_name': f'order good {numb}',
+                    'seller_id': seller_id,
+                    'category_id': category_id,
+                    'unit_price': price
+                }
+                for numb in range(count)
+            ]).returning(
+                Good.id
+            )
+        ids = (await session.execute(stmt)).scalars().all()
+        await replace_prices(session, added=[(category_id, price)] * count)
+        await session.commit()
+        return ids
 
 
 class TestManagement:
@@ -13,6 +87,25 @@ class TestManagement:
     async def test_create_users(self, test_user):
         pass
 
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize(
+        "category, category_id",
+        [
+            (
+                CategoryType.beverages,
+                1
+            ),
+            (
+                CategoryType.cars,
+                3
+            )
+        ]
+    )
+    async def test_category_registry(self, category, category_id):
+        async for session in session_user():
+            assert await registry.get_id(category, session) == category_id
+            assert await registry.get_name(category_id, session) == category
+
     @pytest.mark.asyncio
     @pytest.mark.parametrize(
         "data_user, data_good, status, exception",
@@ -145,7 +238,9 @@ class TestManagement:
             response = await client.get(f"/goods/my_goods", cookies=cookie_app)
             assert response.status_code == status
             if response.json() != f'Nothing':
-                assert (item['good_name'] in exception for item in response.json())
+                assert all(
+                    item['good_name'] in exception for item in response.json()['items']
+                )
 
     @pytest.mark.asyncio
     @pytest.mark.parametrize(
@@ -170,10 +265,75 @@ class TestManagement:
             response = await client.get(f"/goods/seller/{seller_id}")
 
             if not isinstance(response.json(), str):
-                assert any([item['seller_name'] == exception for item in response.json()])
+                assert any([item['seller_name'] == exception for item in response.json()['items']])
             else:
                 assert response.json() == exception 
 
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize(
+        "url, header",
+        [
+            (
+                f"/goods/seller/6",
+                f"ETag"
+            ),
+            (
+                f"/goods/search",
+                f"Last-Modified"
+            ),
+            (
+                f"/users/6",
+                f"ETag"
+            )
+        ]
+    )
+    async def test_conditional_get(self, url, header, query_counter):
+        async with AsyncClient(
+            transport=ASGITransport(app=app),
+            base_url="http://test"
+        ) as client:
+            
+            response = await client.get(url)
+            assert response.status_code == 200
+            assert header in response.headers
+
+            condition = 'If-None-Match' if header == 'ETag' else 'If-Modified-Since'
+            query_counter.clear()
+            response = await client.get(url, headers={condition: response.headers[header]})
+            assert response.status_code == 304
+            assert len(query_counter) == 0
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize(
+        "export_format, lines",
+        [
+            (
+                f"ndjson",
+                3
+            ),
+            (
+                f"csv",
+                4
+            )
+        ]
+    )
+    async def test_export_goods(self, export_format, lines):
+        async with AsyncClient(
+            transport=ASGITransport(app=app),
+            base_url="http://test"
+        ) as client:
+            
+            params = {'format': export_format, 'seller_id': 6}
+            async with client.stream("GET", f"/goods/export", params=params) as response:
+                assert response.status_code == 200
+                body = [line async for line in response.aiter_lines() if line]
+
+            assert len(body) == lines
+            if export_format == 'ndjson':
+                assert {json.loads(item)['good_name'] for item in body} == {"rx8", "rx7", "pubg"}
+            else:
+                assert body[0].startswith('id,seller_id,seller_name')
+
     @pytest.mark.asyncio
     @pytest.mark.parametrize(
         "category, min_coast, max_coast, status, exception",
@@ -228,10 +388,148 @@ class TestManagement:
 
             if isinstance(response.json(), str):
                 assert response.json() == exception
-            elif len(response.json()) == 1:
-                assert response.json()[0]['good_name'] == exception
+            elif len(response.json()['items']) == 1:
+                assert response.json()['items'][0]['good_name'] == exception
             else:
-                assert len(response.json()) == exception
+                assert len(response.json()['items']) == exception
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize(
+        "params, exception",
+        [
+            (
+                {'q': 'rx7'},
+                ["rx7", "rx8"]
+            ),
+            (
+                {'q': 'rx', 'category': 'cars', 'max_price': 27},
+                ["rx8"]
+            ),
+            (
+                {'q': 'pub'},
+                ["pubg"]
+            ),
+            (
+                {'q': 'pubg', 'category': 'cars'},
+                f"Goods to params are not found"
+            ),
+        ]
+    )
+    async def test_find_by_name(self, params, exception):
+        async with AsyncClient(
+            transport=ASGITransport(app=app),
+            base_url="http://test"
+        ) as client:
+            
+            response = await client.get(f"/goods/search", params=params)
+            assert response.status_code == 200
+
+            if isinstance(exception, str):
+                assert response.json() == exception
+            else:
+                names = [item['good_name'] for item in response.json()['items']]
+                assert names[:len(exception)] == exception
+
+    @pytest.mark.asyncio
+    async def test_find_by_filter_facets(self, query_counter):
+        async with AsyncClient(
+            transport=ASGITransport(app=app),
+            base_url="http://test"
+        ) as client:
+            
+            params = {'limit': 1, 'facets': True, 'bucket_width': 10}
+            response = await client.get(f"/goods/search", params=params)
+            assert response.status_code == 200
+            assert len(query_counter) == 1
+
+            page = response.json()
+            assert len(page['items']) == 1
+            assert page['facets']['categories'] == [
+                {'category': 'cars', 'good_count': 2},
+                {'category': 'games', 'good_count': 1}
+            ]
+            assert [
+                (item['min_price'], item['good_count'])
+                for item in page['facets']['prices']
+            ] == [(0, 1), (20, 1), (30, 1)]
+
+            # a tiny width cannot blow up the histogram
+            params['bucket_width'] = 0.001
+            response = await client.get(f"/goods/search", params=params)
+            prices = response.json()['facets']['prices']
+            assert len(prices) <= FACET_MAX_BUCKETS
+            assert sum(item['good_count'] for item in prices) == 3
+            assert prices[-1]['max_price'] is None
+
+    @pytest.mark.asyncio
+    async def test_find_by_filter_pages(self):
+        async with AsyncClient(
+            transport=ASGITransport(app=app),
+            base_url="http://test"
+        ) as client:
+            
+            names = []
+            params = {'limit': 1}
+            while True:
+                response = await client.get(f"/goods/search", params=params)
+                assert response.status_code == 200
+                page = response.json()
+                assert len(page['items']) == 1
+                names.append(page['items'][0]['good_name'])
+                if not page['next_cursor']:
+                    break
+                params['cursor'] = page['next_cursor']
+
+            assert names == ["pubg", "rx8", "rx7"]
+
+            response = await client.get(f"/goods/search", params={'cursor': 'broken'})
+            assert response.status_code == 400
+            assert response.json()['detail'] == f"Invalid cursor"
+
+    @pytest.mark.asyncio
+    async def test_find_by_filter_single_query(self, query_counter):
+        async with AsyncClient(
+            transport=ASGITransport(app=app),
+            base_url="http://test"
+        ) as client:
+            
+            response = await client.get(f"/goods/search", params={'category': 'cars'})
+            assert response.status_code == 200
+
+            assert len(query_counter) == 1
+            assert 'GROUP BY' not in query_counter[0][0]
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize(
+        "url, params, index",
+        [
+            (
+                f"/goods/search",
+                {'category': 'cars', 'min_price': 10},
+                f"ix_good_category_id_unit_price"
+            ),
+            (
+                f"/goods/search",
+                {'min_price': 10},
+                f"ix_good_unit_price_id"
+            ),
+            (
+                f"/goods/seller/6",
+                {},
+                f"ix_good_seller_id_id"
+            )
+        ]
+    )
+    async def test_goods_index_usage(self, url, params, index, query_counter):
+        async with AsyncClient(
+            transport=ASGITransport(app=app),
+            base_url="http://test"
+        ) as client:
+            
+            response = await client.get(url, params=params)
+            assert response.status_code == 200
+
+            assert index in await explain(*query_counter[-1])
 
     @pytest.mark.asyncio 
     @pytest.mark.parametrize(
@@ -261,6 +559,33 @@ class TestManagement:
             response = await client.patch("/goods/change_price", params=values)
             assert response.status_code == 200
     
+    @pytest.mark.asyncio
+    async def test_search_cache(self, query_counter):
+        async with AsyncClient(
+            transport=ASGITransport(app=app),
+            base_url="http://test"
+        ) as client:
+            
+            params = {'category': 'games'}
+            response = await client.get(f"/goods/search", params=params)
+            assert response.status_code == 200
+            assert len(query_counter) == 1
+
+            query_counter.clear()
+            cached = await client.get(f"/goods/search", params=params)
+            assert cached.json() == response.json()
+            assert len(query_counter) == 0
+
+            response = await client.patch(
+                "/goods/change_price", params={'id': 3, 'price': 4.0}
+            )
+            assert response.status_code == 200
+
+            query_counter.clear()
+            response = await client.get(f"/goods/search", params=params)
+            assert len(query_counter) == 1
+            assert response.json()['items'][0]['good_price'] == 4.0
+
     @pytest.mark.asyncio
     @pytest.mark.parametrize(
         "good_id, status, exception",
@@ -315,6 +640,28 @@ class TestManagement:
                 },
                 200,
                 f"Ur order was created. U get a message with details of order"
+            ),
+            (
+                [1, 2],
+                [1],
+                f'Baku',
+                {
+                    'email': 'custver@gmail.com',
+                    'password': 'Bb3##'
+                },
+                488,
+                {'detail': f"Lists of goods and counts have different length"}
+            ),
+            (
+                [1, 73],
+                [1, 1],
+                f'Baku',
+                {
+                    'email': 'custver@gmail.com',
+                    'password': 'Bb3##'
+                },
+                489,
+                {'detail': f"Goods [73] are not exists"}
             )
         ]
     )
@@ -374,7 +721,69 @@ class TestManagement:
             if response.status_code == 404:
                 assert response.json()['detail'] == exception
             else:
-                assert isinstance(response.json(), list) and len(response.json()) == 2
+                orders = response.json()['items']
+                assert len(orders) == 2 and orders[0]['id'] > orders[1]['id']
+                assert sorted(item['item_count'] for item in orders) == [9, 10]
+                for item in orders:
+                    assert sum(line['quantity'] for line in item['lines']) == item['item_count']
+                    assert sum(line['price'] for line in item['lines']) == \
+                        pytest.approx(item['total_amount'])
+
+                response = await client.get(
+                    f"/orders/my_orders", params={'limit': 1}, cookies=cookie_app
+                )
+                page = response.json()
+                assert [item['id'] for item in page['items']] == [orders[0]['id']]
+                response = await client.get(
+                    f"/orders/my_orders",
+                    params={'limit': 1, 'cursor': page['next_cursor']},
+                    cookies=cookie_app
+                )
+                assert [item['id'] for item in response.json()['items']] == [orders[1]['id']]
+
+                # a timestamp out of the datetime range is a bad cursor
+                response = await client.get(
+                    f"/orders/my_orders",
+                    params={'cursor': encode_cursor(10 ** 20, 1)},
+                    cookies=cookie_app
+                )
+                assert response.status_code == 400
+                assert response.json()['detail'] == f"Invalid cursor"
+
+    @pytest.mark.asyncio
+    async def test_orders_index_usage(self, query_counter):
+        async with AsyncClient(
+            transport=ASGITransport(app=app),
+            base_url="http://test"
+        ) as client:
+            
+            payload = {
+                'email': 'custver@gmail.com',
+                'password': 'Bb3##'
+            }
+            response = await client.post(f'/login', data=payload)
+            cookie_app = {'e_commerce': response.cookies.get('e_commerce')}
+
+            query_counter.clear()
+            response = await client.get(f"/orders/my_orders", cookies=cookie_app)
+            assert response.status_code == 200
+
+            # partitions carry their own copy of ix_order_customer_id_date_order_id
+            assert f"customer_id_date_order_id_idx" in await explain(*query_counter[-1])
+
+    @pytest.mark.asyncio
+    async def test_order_detail_index_usage(self):
+        query = \
+            select(
+                OrderDetail.order_id
+            ).filter(
+                OrderDetail.good_id == 1
+            ).compile(
+                engine_test, compile_kwargs={'literal_binds': True}
+            )
+
+        # partitions carry their own copy of ix_order_detail_good_id
+        assert f"good_id_idx" in await explain(str(query), ())
                 
     @pytest.mark.asyncio
     @pytest.mark.parametrize(
@@ -405,3 +814,1026 @@ class TestManagement:
                 assert response.json()['detail'] == exception
             else:
                 assert response.json() == exception
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize(
+        "content_type, body, inserted, errors",
+        [
+            (
+                f"text/csv",
+                (
+                    'good_name,good_category,good_price\n'
+                    'latte,beverages,2.5\n'
+                    '"tea, green",beverages,1.2\n'
+                    'mocha,drinks,3\n'
+                    'espresso,beverages,cheap\n'
+                ),
+                2,
+                [3, 4]
+            ),
+            (
+                f"text/csv",
+                (
+                    'good_name,good_category,good_price\n'
+                    'latte,beverages,2.5\n'
+                    '"mocha,beverages,3\n'
+                    'tea,beverages,1.2\n'
+                ),
+                1,
+                [2]
+            ),
+            (
+                f"text/csv",
+                (
+                    'good_name,good_category,good_price\n'
+                    '"mocha,beverages,3\n' +
+                    'tea,beverages,1.2\n' * 150 +
+                    'latte,beverages,2.5\n'
+                ),
+                52,
+                [1]
+            ),
+            (
+                f"application/x-ndjson",
+                (
+                    '{"good_name": "gum", "good_category": "confections", "good_price": 0.5}\n'
+                    '{"good_name": "cake"\n'
+                    '\n'
+                    '{"good_name": "candy", "good_category": "confections", "good_price": 0.7}\n'
+                ),
+                2,
+                [2]
+            ),
+            (
+                f"application/json",
+                '[]',
+                None,
+                None
+            )
+        ]
+    )
+    async def test_add_goods_bulk(self, content_type, body, inserted, errors):
+        async with AsyncClient(
+            transport=ASGITransport(app=app),
+            base_url="http://test"
+        ) as client:
+            
+            payload = {
+                'email': 'sellver@gmail.com',
+                'password': 'Bb2@@'
+            }
+            response = await client.post(f'/login', data=payload)
+            cookie_app = {'e_commerce': response.cookies.get('e_commerce')}
+
+            response = await client.post(
+                f"/goods/bulk",
+                content=body.encode(),
+                headers={'content-type': content_type},
+                cookies=cookie_app
+            )
+
+            if inserted is None:
+                assert response.status_code == 415
+            else:
+                assert response.status_code == 200
+                assert response.json()['inserted'] == inserted
+                assert [item['row'] for item in response.json()['errors']] == errors
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize(
+        "payload, extra, status",
+        [
+            (
+                {'email': 'sellver@gmail.com', 'password': 'Bb2@@'},
+                [],
+                200
+            ),
+            (
+                {'email': 'sellver@gmail.com', 'password': 'Bb2@@'},
+                [{'good_id': 100000, 'price': 1.0}],
+                493
+            ),
+            (
+                {'email': 'sellnot@gmail.com', 'password': 'Bb4$$'},
+                [],
+                492
+            )
+        ]
+    )
+    async def test_change_prices(self, payload, extra, status):
+        async with AsyncClient(
+            transport=ASGITransport(app=app),
+            base_url="http://test"
+        ) as client:
+            
+            response = await client.post(f'/login', data=payload)
+            cookie_app = {'e_commerce': response.cookies.get('e_commerce')}
+
+            ids = await seller_goods(6)
+            data = [{'good_id': item, 'price': 9.9} for item in ids] + extra
+            response = await client.patch(
+                f"/goods/change_price/batch", json=data, cookies=cookie_app
+            )
+
+            assert response.status_code == status
+            if status == 200:
+                assert response.json() == len(ids)
+
+    @pytest.mark.asyncio
+    @pytest.mark.benchmark
+    async def test_change_prices_benchmark(self):
+        async with AsyncClient(
+            transport=ASGITransport(app=app),
+            base_url="http://test"
+        ) as client:
+            
+            payload = {
+                'email': 'sellver@gmail.com',
+                'password': 'Bb2@@'
+            }
+            response = await client.post(f'/login', data=payload)
+            cookie_app = {'e_commerce': response.cookies.get('e_commerce')}
+
+            body = "good_name,good_category,good_price\n" + \
+                "".join(f"bench{numb},games,{numb}\n" for numb in range(200))
+            response = await client.post(
+                f"/goods/bulk",
+                content=body.encode(),
+                headers={'content-type': 'text/csv'},
+                cookies=cookie_app
+            )
+            assert response.json()['inserted'] == 200
+            ids = await seller_goods(6)
+
+            start = time.perf_counter()
+            for item in ids:
+                response = await client.patch(
+                    "/goods/change_price", params={'id': item, 'price': 5.5}
+                )
+                assert response.status_code == 200
+            loop_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            response = await client.patch(
+                f"/goods/change_price/batch",
+                json=[{'good_id': item, 'price': 6.5} for item in ids],
+                cookies=cookie_app
+            )
+            assert response.json() == len(ids)
+            batch_time = time.perf_counter() - start
+
+            print(f"\n{len(ids)} prices: loop {loop_time:.3f}s, batch {batch_time:.3f}s")
+            assert batch_time < loop_time
+
+    @pytest.mark.asyncio
+    async def test_category_stats(self):
+        async with AsyncClient(
+            transport=ASGITransport(app=app),
+            base_url="http://test"
+        ) as client:
+            
+            response = await client.get(f"/goods/stats")
+            assert response.status_code == 200
+            stats = {item['category']: item for item in response.json()}
+
+            async for session in session_user():
+                query = \
+                    select(
+                        Category.category_name,
+                        func.count(Good.id).label('good_count'),
+                        func.min(Good.unit_price).label('min_price'),
+                        func.max(Good.unit_price).label('max_price'),
+                        func.avg(Good.unit_price).label('avg_price')
+                    ).join(
+                        Good, Good.category_id == Category.id
+                    ).group_by(
+                        Category.category_name
+                    )
+                expected = (await session.execute(query)).all()
+
+            assert expected
+            for item in expected:
+                current = stats[item.category_name.value]
+                assert current['good_count'] == item.good_count
+                assert current['min_price'] == pytest.approx(item.min_price)
+                assert current['max_price'] == pytest.approx(item.max_price)
+                assert current['avg_price'] == pytest.approx(item.avg_price)
+
+    @pytest.mark.asyncio
+    async def test_add_orders_query_count(self, query_counter, fake_send):
+        async with AsyncClient(
+            transport=ASGITransport(app=app),
+            base_url="http://test"
+        ) as client:
+            
+            payload = {
+                'email': 'custver@gmail.com',
+                'password': 'Bb3##'
+            }
+            response = await client.post(f'/login', data=payload)
+            cookie_app = {'e_commerce': response.cookies.get('e_commerce')}
+
+            goods = await new_goods(50)
+            assert len(goods) == 50
+
+            counts = []
+            for products in (goods[:1], goods):
+                values = {
+                    'product_list': products,
+                    'count_list': [1] * len(products),
+                    'country': f'Moscow'
+                }
+                start = len(query_counter)
+                response = await client.post(f'/orders/add', cookies=cookie_app, json=values)
+                assert response.status_code == 200
+                counts.append(len(query_counter) - start)
+
+            # one mail for the seller and one for the customer per order
+            assert counts[0] == counts[1]
+            assert fake_send.call_count == 4
+
+    @pytest.mark.asyncio
+    async def test_add_orders_prices(self, fake_send):
+        async with AsyncClient(
+            transport=ASGITransport(app=app),
+            base_url="http://test"
+        ) as client:
+            
+            payload = {
+                'email': 'custver@gmail.com',
+                'password': 'Bb3##'
+            }
+            response = await client.post(f'/login', data=payload)
+            cookie_app = {'e_commerce': response.cookies.get('e_commerce')}
+
+            first, second = await new_goods(2)
+            values = {
+                'product_list': [second, first, second],
+                'count_list': [2, 1, 3],
+                'country': f'Moscow'
+            }
+            response = await client.post(f'/orders/add', cookies=cookie_app, json=values)
+            assert response.status_code == 200
+
+            async for session in session_user():
+                order_id = (await session.execute(select(func.max(Order.id)))).scalar()
+                query = \
+                    select(
+                        OrderDetail.good_id,
+                        OrderDetail.quantity,
+                        OrderDetail.price,
+                        Good.unit_price
+                    ).join(
+                        Good, Good.id == OrderDetail.good_id
+                    ).filter(
+                        OrderDetail.order_id == order_id
+                    )
+                lines = {item.good_id: item for item in (await session.execute(query)).all()}
+                order = (await session.execute(
+                    select(Order).filter(Order.id == order_id)
+                )).scalar()
+
+            assert lines[first].quantity == 1
+            assert order.item_count == 6
+            assert order.total_amount == pytest.approx(
+                sum(item.price for item in lines.values())
+            )
+            assert lines[second].quantity == 5
+            for item in lines.values():
+                assert item.price == pytest.approx(item.unit_price * item.quantity)
+
+    @pytest.mark.asyncio
+    async def test_add_orders_idempotency(self, fake_send):
+        async with AsyncClient(
+            transport=ASGITransport(app=app),
+            base_url="http://test"
+        ) as client:
+            
+            payload = {
+                'email': 'custver@gmail.com',
+                'password': 'Bb3##'
+            }
+            response = await client.post(f'/login', data=payload)
+            cookie_app = {'e_commerce': response.cookies.get('e_commerce')}
+
+            async def orders_count() -> int:
+                async for session in session_user():
+                    return (await session.execute(select(func.count(Order.id)))).scalar()
+
+            values = {
+                'product_list': await new_goods(2),
+                'count_list': [1, 1],
+                'country': f'Moscow'
+            }
+            headers = {'Idempotency-Key': 'checkout-1'}
+            before = await orders_count()
+
+            responses = await asyncio.gather(*[
+                client.post(f'/orders/add', cookies=cookie_app, json=values, headers=headers)
+                for _ in range(3)
+            ])
+            assert [item.status_code for item in responses] == [200] * 3
+            assert len({item.text for item in responses}) == 1
+            assert sum(
+                item.headers.get('Idempotent-Replayed') == 'true' for item in responses
+            ) == 2
+
+            response = await client.post(
+                f'/orders/add', cookies=cookie_app, json=values, headers=headers
+            )
+            assert response.headers.get('Idempotent-Replayed') == 'true'
+            assert await orders_count() == before + 1
+            # one mail for the seller and one for the customer
+            assert fake_send.call_count == 2
+
+            # a failed attempt leaves the key free for the retry
+            values['product_list'] = [10 ** 9, 10 ** 9 + 1]
+            headers = {'Idempotency-Key': 'checkout-2'}
+            for _ in range(2):
+                response = await client.post(
+                    f'/orders/add', cookies=cookie_app, json=values, headers=headers
+                )
+                assert response.status_code == 489
+
+            # once the order is committed, a failure after it keeps the key
+            values['product_list'] = await new_goods(1)
+            values['count_list'] = [1]
+            headers = {'Idempotency-Key': 'checkout-3'}
+            before = await orders_count()
+            with patch('management.router.seller_order', side_effect=RuntimeError):
+                with pytest.raises(RuntimeError):
+                    await client.post(
+                        f'/orders/add', cookies=cookie_app, json=values, headers=headers
+                    )
+            response = await client.post(
+                f'/orders/add', cookies=cookie_app, json=values, headers=headers
+            )
+            assert response.status_code == 200
+            assert response.headers.get('Idempotent-Replayed') == 'true'
+            assert await orders_count() == before + 1
+
+    @pytest.mark.asyncio
+    async def test_run_once_renews_claim(self, monkeypatch):
+        # the claim would expire twice over while the first run is busy
+        monkeypatch.setattr(cache, 'IDEMPOTENCY_LOCK_TTL', 1)
+        calls = []
+
+        async def run() -> dict:
+            calls.append(1)
+            await asyncio.sleep(2.5)
+            return {'order_id': 1}
+
+        async def late() -> tuple:
+            await asyncio.sleep(1.5)
+            return await cache.run_once('renew-test', run)
+
+        first, second = await asyncio.gather(cache.run_once('renew-test', run), late())
+        assert first == ({'order_id': 1}, False)
+        assert second == ({'order_id': 1}, True)
+        assert len(calls) == 1
+
+    @pytest.mark.asyncio
+    async def test_order_writer(self):
+        goods = await new_goods(2)
+        user_id = await customer_id('custver@gmail.com')
+        writer = OrderWriter(window=0.01, max_batch=100, timeout=30)
+        writer.start()
+        try:
+            results = await asyncio.gather(
+                writer.submit(OrderRequest(user_id, 'Moscow', goods, [1, 2])),
+                writer.submit(OrderRequest(user_id, 'Moscow', [10 ** 9], [1])),
+                writer.submit(OrderRequest(user_id, 'Moscow', goods, [1])),
+                writer.submit(OrderRequest(user_id, 'Baku', goods[:1], [3])),
+                return_exceptions=True
+            )
+        finally:
+            await writer.stop()
+
+        assert isinstance(results[1], LookupError)
+        assert isinstance(results[2], ValueError)
+        assert len({results[0], results[3]}) == 2
+
+        async for session in session_user():
+            query = \
+                select(
+                    OrderDetail.order_id,
+                    func.count()
+                ).filter(
+                    OrderDetail.order_id.in_([results[0], results[3]])
+                ).group_by(
+                    OrderDetail.order_id
+                )
+            lines = dict((await session.execute(query)).tuples().all())
+            country = (await session.execute(
+                select(Order.ship_country).filter(Order.id == results[3])
+            )).scalar()
+
+        assert lines == {results[0]: 2, results[3]: 1}
+        assert country == 'Baku'
+
+    @pytest.mark.asyncio
+    async def test_order_writer_down(self):
+        goods = await new_goods(1)
+        user_id = await customer_id('custver@gmail.com')
+        request = OrderRequest(user_id, 'Moscow', goods, [1])
+
+        writer = OrderWriter(window=10, max_batch=100, timeout=0.05)
+        with pytest.raises(OrderWriterDown):
+            await writer.submit(request)
+
+        writer.start()
+        try:
+            with pytest.raises(asyncio.TimeoutError):
+                await writer.submit(request)
+
+            # stopping fails whatever was still waiting for a batch
+            writer.timeout = 30
+            waiting = [asyncio.create_task(writer.submit(request)) for _ in range(2)]
+            await asyncio.sleep(0.05)
+        finally:
+            await writer.stop()
+        results = await asyncio.gather(*waiting, return_exceptions=True)
+        assert all(isinstance(item, OrderWriterDown) for item in results)
+
+        async for session in session_user():
+            count = (await session.execute(
+                select(func.count()).select_from(OrderDetail).filter(
+                    OrderDetail.good_id == goods[0]
+                )
+            )).scalar()
+        assert count == 0
+
+    @pytest.mark.asyncio
+    async def test_order_writer_bad_order(self):
+        goods = await new_goods(1)
+        user_id = await customer_id('custver@gmail.com')
+        writer = OrderWriter(window=0.05, max_batch=100, timeout=30)
+        writer.start()
+        try:
+            # an id out of the int4 range fails the statement of the batch
+            results = await asyncio.gather(
+                writer.submit(OrderRequest(user_id, 'Moscow', goods, [1])),
+                writer.submit(OrderRequest(user_id, 'Moscow', [2 ** 40], [1])),
+                writer.submit(OrderRequest(user_id, 'Moscow', goods, [2])),
+                return_exceptions=True
+            )
+        finally:
+            await writer.stop()
+
+        assert isinstance(results[1], DataError)
+        assert isinstance(results[0], int) and isinstance(results[2], int)
+
+    @pytest.mark.asyncio
+    async def test_order_writer_timeout_in_flight(self):
+        goods = await new_goods(1)
+        user_id = await customer_id('custver@gmail.com')
+
+        async def slow(session, requests):
+            await asyncio.sleep(0.2)
+            return await place_orders(session, requests)
+
+        writer = OrderWriter(window=0.01, max_batch=100, timeout=0.05)
+        writer.start()
+        try:
+            # the batch is committing when the timeout hits, the order is kept
+            with patch('management.order_writer.place_orders', slow):
+                order_id = await writer.submit(
+                    OrderRequest(user_id, 'Moscow', goods, [1])
+                )
+        finally:
+            await writer.stop()
+
+        async for session in session_user():
+            count = (await session.execute(
+                select(func.count()).select_from(Order).filter(Order.id == order_id)
+            )).scalar()
+        assert count == 1
+
+    @pytest.mark.asyncio
+    @pytest.mark.benchmark
+    async def test_order_writer_benchmark(self):
+        goods = await new_goods(3)
+        user_id = await customer_id('custver@gmail.com')
+        total = 300
+
+        async def single() -> int:
+            async with AsyncSessionTest() as session:
+                order_id = await place_order(session, user_id, 'Moscow', goods, [1, 1, 1])
+                await session.commit()
+                return order_id
+
+        start = time.perf_counter()
+        ids = await asyncio.gather(*[single() for _ in range(total)])
+        single_rate = total / (time.perf_counter() - start)
+        assert len(set(ids)) == total
+
+        writer = OrderWriter(window=0.005, max_batch=500, timeout=30)
+        writer.start()
+        try:
+            start = time.perf_counter()
+            ids = await asyncio.gather(*[
+                writer.submit(OrderRequest(user_id, 'Moscow', goods, [1, 1, 1]))
+                for _ in range(total)
+            ])
+            batch_rate = total / (time.perf_counter() - start)
+        finally:
+            await writer.stop()
+        assert len(set(ids)) == total
+
+        print(f"\n{total} orders: per request {single_rate:.0f}/s, grouped {batch_rate:.0f}/s")
+        assert batch_rate > single_rate
+
+    @pytest.mark.asyncio
+    async def test_stock_reservation(self, fake_send):
+        async with AsyncClient(
+            transport=ASGITransport(app=app),
+            base_url="http://test"
+        ) as client:
+            
+            response = await client.post(
+                f'/login', data={'email': 'sellver@gmail.com', 'password': 'Bb2@@'}
+            )
+            seller_cookie = {'e_commerce': response.cookies.get('e_commerce')}
+            response = await client.post(
+                f'/login', data={'email': 'custver@gmail.com', 'password': 'Bb3##'}
+            )
+            cookie_app = {'e_commerce': response.cookies.get('e_commerce')}
+
+            hot, plain = await new_goods(2)
+            response = await client.patch(
+                f"/goods/stock", params={'id': hot, 'stock': 100}, cookies=seller_cookie
+            )
+            assert response.status_code == 200
+            response = await client.patch(
+                f"/goods/stock", params={'id': hot, 'stock': 100}, cookies=cookie_app
+            )
+            assert response.status_code == 491
+
+            async def checkouts(good_id: int, total: int) -> list[int]:
+                values = {
+                    'product_list': [good_id],
+                    'count_list': [1],
+                    'country': f'Moscow'
+                }
+                responses = await asyncio.gather(*[
+                    client.post(f'/orders/add', cookies=cookie_app, json=values)
+                    for _ in range(total)
+                ])
+                return [item.status_code for item in responses]
+
+            async def sold() -> tuple[int, int]:
+                async for session in session_user():
+                    stock = (await session.execute(
+                        select(Good.stock).filter(Good.id == hot)
+                    )).scalar()
+                    quantity = (await session.execute(
+                        select(
+                            func.coalesce(func.sum(OrderDetail.quantity), 0)
+                        ).filter(
+                            OrderDetail.good_id == hot
+                        )
+                    )).scalar()
+                    return stock, quantity
+
+            codes = await checkouts(plain, 1000)
+            assert codes == [200] * 1000
+
+            _, before = await sold()
+            codes = await checkouts(hot, 1000)
+            assert codes.count(200) == 100
+            assert codes.count(409) == 900
+
+            # no oversell: the lines sold match the stock that was there
+            stock, after = await sold()
+            assert stock == 0
+            assert after - before == 100
+
+    @pytest.mark.asyncio
+    @pytest.mark.benchmark
+    async def test_stock_reservation_benchmark(self, fake_send):
+        async with AsyncClient(
+            transport=ASGITransport(app=app),
+            base_url="http://test"
+        ) as client:
+
+            response = await client.post(
+                f'/login', data={'email': 'sellver@gmail.com', 'password': 'Bb2@@'}
+            )
+            seller_cookie = {'e_commerce': response.cookies.get('e_commerce')}
+            response = await client.post(
+                f'/login', data={'email': 'custver@gmail.com', 'password': 'Bb3##'}
+            )
+            cookie_app = {'e_commerce': response.cookies.get('e_commerce')}
+
+            hot, plain = await new_goods(2)
+            response = await client.patch(
+                f"/goods/stock", params={'id': hot, 'stock': 100}, cookies=seller_cookie
+            )
+            assert response.status_code == 200
+
+            async def checkouts(good_id: int, total: int) -> tuple[list[int], float]:
+                values = {
+                    'product_list': [good_id],
+                    'count_list': [1],
+                    'country': f'Moscow'
+                }
+                start = time.perf_counter()
+                responses = await asyncio.gather(*[
+                    client.post(f'/orders/add', cookies=cookie_app, json=values)
+                    for _ in range(total)
+                ])
+                return [item.status_code for item in responses], \
+                    total / (time.perf_counter() - start)
+
+            codes, plain_rate = await checkouts(plain, 1000)
+            assert codes == [200] * 1000
+            codes, hot_rate = await checkouts(hot, 1000)
+            assert codes.count(200) == 100
+
+            # checkouts of one stocked good keep up with untracked ones
+            print(f"\n1000 checkouts: untracked {plain_rate:.0f}/s, one hot good {hot_rate:.0f}/s")
+            assert hot_rate > plain_rate / 2
+
+    @pytest.mark.asyncio
+    async def test_stock_order_writer(self):
+        goods = await new_goods(2)
+        user_id = await customer_id('custver@gmail.com')
+        async for session in session_user():
+            await session.execute(
+                update(Good).filter(Good.id.in_(goods)).values(stock=20)
+            )
+            await session.commit()
+
+        writer = OrderWriter(window=0.01, max_batch=100, timeout=30)
+        writer.start()
+        try:
+            results = await asyncio.gather(*[
+                writer.submit(OrderRequest(user_id, 'Moscow', goods, [1, 1]))
+                for _ in range(50)
+            ], return_exceptions=True)
+        finally:
+            await writer.stop()
+
+        assert sum(isinstance(item, int) for item in results) == 20
+        assert sum(isinstance(item, OutOfStock) for item in results) == 30
+
+        async for session in session_user():
+            stock = (await session.execute(
+                select(Good.stock).filter(Good.id.in_(goods))
+            )).scalars().all()
+        assert stock == [0, 0]
+
+    @pytest.mark.asyncio
+    async def test_hot_stock(self, fake_send):
+        async with AsyncClient(
+            transport=ASGITransport(app=app),
+            base_url="http://test"
+        ) as client:
+            
+            response = await client.post(
+                f'/login', data={'email': 'sellver@gmail.com', 'password': 'Bb2@@'}
+            )
+            seller_cookie = {'e_commerce': response.cookies.get('e_commerce')}
+            response = await client.post(
+                f'/login', data={'email': 'custver@gmail.com', 'password': 'Bb3##'}
+            )
+            cookie_app = {'e_commerce': response.cookies.get('e_commerce')}
+
+            hot, untracked = await new_goods(2)
+            response = await client.patch(
+                f"/goods/hot", params={'id': untracked, 'shards': 8}, cookies=seller_cookie
+            )
+            assert response.status_code == 494
+            response = await client.patch(
+                f"/goods/hot", params={'id': hot, 'shards': 8}, cookies=cookie_app
+            )
+            assert response.status_code == 491
+            response = await client.patch(
+                f"/goods/stock", params={'id': hot, 'stock': 200}, cookies=seller_cookie
+            )
+            assert response.status_code == 200
+            response = await client.patch(
+                f"/goods/hot", params={'id': hot, 'shards': 8}, cookies=seller_cookie
+            )
+            assert response.status_code == 200
+
+            async def shards() -> tuple[int, list[int]]:
+                async for session in session_user():
+                    stock = (await session.execute(
+                        select(Good.stock).filter(Good.id == hot)
+                    )).scalar()
+                    rows = (await session.execute(
+                        select(
+                            GoodStockShard.stock
+                        ).filter(
+                            GoodStockShard.good_id == hot
+                        ).order_by(
+                            GoodStockShard.shard
+                        )
+                    )).scalars().all()
+                    return stock, rows
+
+            assert await shards() == (0, [25] * 8)
+
+            values = {
+                'product_list': [hot],
+                'count_list': [1],
+                'country': f'Moscow'
+            }
+            responses = await asyncio.gather(*[
+                client.post(f'/orders/add', cookies=cookie_app, json=values)
+                for _ in range(1000)
+            ])
+            codes = [item.status_code for item in responses]
+            assert codes.count(200) == 200
+            assert codes.count(409) == 800
+            assert await shards() == (0, [0] * 8)
+
+            # a cancelled order gives its unit back to one of the shards
+            response = await client.delete(
+                f"/orders/delete", params={'id': responses[codes.index(200)].json()['order_id']},
+                cookies=cookie_app
+            )
+            assert response.status_code == 200
+            stock, rows = await shards()
+            assert stock == 0 and sum(rows) == 1
+
+    @pytest.mark.asyncio
+    async def test_hot_stock_across_shards(self):
+        good = (await new_goods(1))[0]
+        user_id = await customer_id('custver@gmail.com')
+        async for session in session_user():
+            await session.execute(
+                update(Good).filter(Good.id == good).values(stock=20, stock_shards=4)
+            )
+            await rebalance(session, [good])
+            await session.commit()
+
+            async def shards() -> list[int]:
+                return (await session.execute(
+                    select(GoodStockShard.stock).filter(
+                        GoodStockShard.good_id == good
+                    ).order_by(GoodStockShard.shard)
+                )).scalars().all()
+
+            assert await shards() == [5, 5, 5, 5]
+
+            # no shard holds 10, together they do
+            await place_order(session, user_id, 'Moscow', [good], [10])
+            await session.commit()
+            assert sum(await shards()) == 10
+
+            with pytest.raises(OutOfStock):
+                await place_order(session, user_id, 'Moscow', [good], [11])
+            await session.rollback()
+
+            order_id = await place_order(session, user_id, 'Moscow', [good], [10])
+            await session.commit()
+            assert await shards() == [0, 0, 0, 0]
+
+            # a deleted order gives its units back through shard 0
+            date_order = (await session.execute(
+                select(Order.date_order).filter(Order.id == order_id)
+            )).scalar()
+            await release_stock(session, order_id, date_order)
+            await session.commit()
+            assert await shards() == [10, 0, 0, 0]
+
+    @pytest.mark.asyncio
+    async def test_stock_rebalance(self):
+        good = (await new_goods(1))[0]
+        async for session in session_user():
+            await session.execute(
+                update(Good).filter(Good.id == good).values(stock=10, stock_shards=4)
+            )
+            await rebalance(session, [good])
+            rows = (await session.execute(
+                select(GoodStockShard.stock).filter(
+                    GoodStockShard.good_id == good
+                ).order_by(GoodStockShard.shard)
+            )).scalars().all()
+            assert rows == [3, 3, 2, 2]
+
+            # dry shards are refilled from the others, fewer shards fold the rest
+            await session.execute(
+                update(GoodStockShard).filter(
+                    GoodStockShard.good_id == good,
+                    GoodStockShard.shard < 2
+                ).values(stock=0)
+            )
+            await session.execute(
+                update(Good).filter(Good.id == good).values(stock_shards=2)
+            )
+            await rebalance(session, [good])
+            rows = (await session.execute(
+                select(GoodStockShard.stock).filter(
+                    GoodStockShard.good_id == good
+                ).order_by(GoodStockShard.shard)
+            )).scalars().all()
+            assert rows == [2, 2]
+
+            await session.execute(
+                update(Good).filter(Good.id == good).values(stock_shards=0)
+            )
+            await rebalance(session, [good])
+            stock = (await session.execute(
+                select(Good.stock).filter(Good.id == good)
+            )).scalar()
+            rows = (await session.execute(
+                select(GoodStockShard.stock).filter(GoodStockShard.good_id == good)
+            )).scalars().all()
+            assert stock == 4 and rows == []
+            await session.commit()
+
+    @pytest.mark.asyncio
+    async def test_order_intake(self, fake_send, monkeypatch):
+        monkeypatch.setattr(setting, 'ORDER_INTAKE', True)
+        intake = OrderIntake(
+            setting.ORDER_INTAKE_STREAM, setting.ORDER_INTAKE_GROUP, 100
+        )
+        await intake.setup()
+        goods = await new_goods(2)
+
+        async with AsyncClient(
+            transport=ASGITransport(app=app),
+            base_url="http://test"
+        ) as client:
+            
+            response = await client.post(
+                f'/login', data={'email': 'custver@gmail.com', 'password': 'Bb3##'}
+            )
+            cookie_app = {'e_commerce': response.cookies.get('e_commerce')}
+            response = await client.post(
+                f'/login', data={'email': 'sellver@gmail.com', 'password': 'Bb2@@'}
+            )
+            seller_cookie = {'e_commerce': response.cookies.get('e_commerce')}
+
+            response = await client.post(f'/orders/add', cookies=cookie_app, json={
+                'product_list': [],
+                'count_list': [],
+                'country': f'Moscow'
+            })
+            assert response.status_code == 488
+
+            tokens = []
+            for products in ([goods[0]], goods, [10**9]):
+                response = await client.post(f'/orders/add', cookies=cookie_app, json={
+                    'product_list': products,
+                    'count_list': [1] * len(products),
+                    'country': f'Moscow'
+                })
+                assert response.status_code == 202
+                assert response.headers['location'] == f"/orders/status/{response.json()}"
+                tokens.append(response.json())
+            assert fake_send.call_count == 0
+
+            response = await client.get(f'/orders/status/{tokens[0]}', cookies=cookie_app)
+            assert response.status_code == 200
+            assert response.json()['status'] == 'pending'
+            response = await client.get(f'/orders/status/{tokens[0]}', cookies=seller_cookie)
+            assert response.status_code == 404
+
+            # one poll writes the whole backlog in one transaction
+            assert await intake.poll('test', block=100) == 3
+            assert await intake.poll('test', block=100) == 0
+
+            statuses = []
+            for token in tokens:
+                response = await client.get(f'/orders/status/{token}', cookies=cookie_app)
+                statuses.append(response.json())
+            assert [item['status'] for item in statuses] == ['placed', 'placed', 'failed']
+            assert statuses[2]['detail'] == f"Goods [{10**9}] are not exists"
+            assert fake_send.call_count > 0
+
+            response = await client.get(f'/orders/my_orders', cookies=cookie_app)
+            order_ids = [item['id'] for item in response.json()['items']]
+            assert statuses[0]['order_id'] in order_ids
+            assert statuses[1]['order_id'] in order_ids
+
+    @pytest.mark.asyncio
+    async def test_order_intake_redelivery(self, fake_send):
+        intake = OrderIntake(
+            setting.ORDER_INTAKE_STREAM, setting.ORDER_INTAKE_GROUP, 100
+        )
+        await intake.setup()
+        goods = await new_goods(1)
+        user_id = await customer_id('custver@gmail.com')
+        token = await enqueue_order(
+            OrderRequest(user_id, 'Moscow', goods, [1]), 'custver@gmail.com'
+        )
+        assert await intake.poll('test', block=100) == 1
+        placed = await order_status(token)
+
+        async def orders_count() -> int:
+            async for session in session_user():
+                return (await session.execute(
+                    select(func.count()).select_from(OrderDetail).filter(
+                        OrderDetail.good_id == goods[0]
+                    )
+                )).scalar()
+
+        # the worker died after the commit: the status is lost and the
+        # entry comes again, but the order is not placed twice
+        await redis.delete(status_key(token))
+        await redis.xadd(setting.ORDER_INTAKE_STREAM, {'order': json.dumps({
+            'token': token,
+            'email': 'custver@gmail.com',
+            'customer_id': user_id,
+            'country': 'Moscow',
+            'products': goods,
+            'counts': [1]
+        })})
+        assert await intake.poll('test', block=100) == 1
+        assert await order_status(token) == placed
+        assert await orders_count() == 1
+
+        # poison entries are dropped, the worker keeps going
+        await redis.xadd(setting.ORDER_INTAKE_STREAM, {'order': 'not json'})
+        await redis.xadd(setting.ORDER_INTAKE_STREAM, {'order': json.dumps({'token': 'x'})})
+        await redis.xadd(setting.ORDER_INTAKE_STREAM, {'other': 'field'})
+        assert await intake.poll('test', block=100) == 3
+        assert await redis.xlen(setting.ORDER_INTAKE_STREAM) == 0
+
+    @pytest.mark.asyncio
+    async def test_sales_rollup(self, fake_send):
+        goods = await new_goods(2)
+        async for session in session_user():
+            prices = dict((await session.execute(
+                select(Good.id, Good.unit_price).filter(Good.id.in_(goods))
+            )).all())
+        roll_up_sales()
+
+        async with AsyncClient(
+            transport=ASGITransport(app=app),
+            base_url="http://test"
+        ) as client:
+            
+            response = await client.post(
+                f'/login', data={'email': 'sellver@gmail.com', 'password': 'Bb2@@'}
+            )
+            seller_cookie = {'e_commerce': response.cookies.get('e_commerce')}
+            response = await client.post(
+                f'/login', data={'email': 'custver@gmail.com', 'password': 'Bb3##'}
+            )
+            cookie_app = {'e_commerce': response.cookies.get('e_commerce')}
+
+            async def analytics() -> dict:
+                response = await client.get(
+                    f'/goods/analytics/goods', params={'limit': 500}, cookies=seller_cookie
+                )
+                assert response.status_code == 200
+                return {
+                    item['good_id']: (item['quantity'], item['revenue'], item['orders'])
+                    for item in response.json() if item['good_id'] in goods
+                }
+
+            before = await analytics()
+            for products, counts in (
+                ([goods[0]], [2]),
+                (goods, [1, 3]),
+                ([goods[1]], [1])
+            ):
+                response = await client.post(f'/orders/add', cookies=cookie_app, json={
+                    'product_list': products,
+                    'count_list': counts,
+                    'country': f'Moscow'
+                })
+                assert response.status_code == 200
+
+            # orders reach the rollup only when the task runs
+            assert await analytics() == before
+            assert roll_up_sales() == 3
+            assert roll_up_sales() == 0
+
+            def added(after: dict, good_id: int) -> tuple:
+                quantity, revenue, orders = after[good_id]
+                old_quantity, old_revenue, old_orders = before.get(good_id, (0, 0, 0))
+                return quantity - old_quantity, round(revenue - old_revenue, 2), orders - old_orders
+
+            after = await analytics()
+            assert added(after, goods[0]) == (3, round(3 * prices[goods[0]], 2), 2)
+            assert added(after, goods[1]) == (4, round(4 * prices[goods[1]], 2), 2)
+
+            response = await client.get(
+                f'/goods/analytics/daily', params={'good_id': goods[1]}, cookies=seller_cookie
+            )
+            assert response.status_code == 200
+            assert sum(item['quantity'] for item in response.json()) >= 4
+
+            # a deleted order is taken back out of the rollup
+            response = await client.get(f'/orders/my_orders', cookies=cookie_app)
+            order_id = response.json()['items'][1]['id']
+            response = await client.delete(f"/orders/delete", params={'id': order_id})
+            assert response.status_code == 200
+            after = await analytics()
+            assert added(after, goods[0]) == (2, round(2 * prices[goods[0]], 2), 1)
+            assert added(after, goods[1]) == (1, round(prices[goods[1]], 2), 1)
+
+            response = await client.get(
+                f'/goods/analytics/daily',
+                params={'date_from': '2100-02-01', 'date_to': '2100-01-01'},
+                cookies=seller_cookie
+            )
+            assert response.status_code == 400
+            response = await client.get(f'/goods/analytics/goods', cookies=cookie_app)
+            assert response.status_code == 491
@@ -0,0 +1,147 @@
+import pytest
+
+from httpx import AsyncClient, ASGITransport
+from sqlalchemy import text
+
+from management.snapshot import GOODS_SQL, CatalogSnapshot, SnapshotBuilder, \
+                                catalog_snapshot, decode_event
+from config import setting
+from conftest import engine_test
+from main import app
+
+
+def catalog_rows():
+    return [
+        (1, 10, 1, 30.0, 'rx7', 'seller_a'),
+        (2, 10, 2, 10.0, 'pubg', 'seller_a'),
+        (3, 11, 1, 20.0, 'rx8', 'seller_b'),
+        (4, 11, 1, 20.0, 'кроссовки', 'seller_b'),
+        (5, 12, 3, 50.0, 'lamp', 'seller_c')
+    ]
+
+
+class TestSnapshot:
+
+    @pytest.fixture
+    def snapshot(self, tmp_path):
+        builder = SnapshotBuilder()
+        builder.replace(catalog_rows())
+        builder.publish(str(tmp_path / 'catalog.snapshot'))
+        return builder, CatalogSnapshot(str(tmp_path / 'catalog.snapshot'))
+
+    @pytest.mark.parametrize(
+            "category_id, min_price, max_price, ids",
+            [
+                (None, None, None, [2, 3, 4, 1, 5]),
+                (1, None, None, [3, 4, 1]),
+                (None, 20, 30, [3, 4, 1]),
+                (1, 25, None, [1]),
+                (2, 20, None, [])
+            ]
+    )
+    def test_search(self, snapshot, category_id, min_price, max_price, ids):
+        _, reader = snapshot
+        rows = reader.search(category_id, min_price, max_price, None, 10)
+        assert [item[0] for item in rows] == ids
+
+    def test_search_pages(self, snapshot):
+        _, reader = snapshot
+        ids = []
+        last = None
+        while True:
+            rows = reader.search(None, None, None, last, 2)
+            ids += [item[0] for item in rows[:2]]
+            if len(rows) <= 2:
+                break
+            last = [rows[1][4], rows[1][0]]
+
+        assert ids == [2, 3, 4, 1, 5]
+
+    def test_row(self, snapshot):
+        _, reader = snapshot
+        assert reader.search(1, 20, 20, [20.0, 3], 10) == [
+            (4, 'кроссовки', 'seller_b', 1, 20.0)
+        ]
+
+    def test_update(self, snapshot):
+        builder, reader = snapshot
+        assert reader.search(None, None, None, None, 10)[0][0] == 2
+
+        # good 2 got a new price, good 5 is gone
+        builder.update({2, 5}, [(2, 10, 2, 40.0, 'pubg', 'seller_a')])
+        builder.publish(reader.path)
+
+        rows = reader.search(None, None, None, None, 10)
+        assert [item[0] for item in rows] == [3, 4, 1, 2]
+        assert rows[-1][4] == 40.0
+
+    def test_update_merge(self, snapshot):
+        builder, reader = snapshot
+
+        # new and changed rows land among equal prices in id order
+        builder.update({3, 6, 7}, [
+            (7, 12, 1, 20.0, 'rx9', 'seller_c'),
+            (3, 11, 1, 20.0, 'rx8', 'seller_b'),
+            (6, 13, 2, 5.0, 'mouse', 'seller_d')
+        ])
+        builder.publish(reader.path)
+
+        rows = reader.search(None, None, None, None, 10)
+        assert [item[0] for item in rows] == [6, 2, 3, 4, 7, 1, 5]
+        assert rows[0][2] == 'seller_d'
+        assert list(builder.prices) == sorted(builder.prices)
+
+    @pytest.mark.parametrize(
+            "payload, event",
+            [
+                ('{"ids": [1, 2]}', {'ids': [1, 2]}),
+                ('{"reload": true}', {'reload': True}),
+                ('{"ids": "1"}', {'reload': True}),
+                ('{"id": [1]}', {'reload': True}),
+                ('[1, 2]', {'reload': True}),
+                ('not json', {'reload': True})
+            ]
+    )
+    def test_decode_event(self, payload, event):
+        assert decode_event(payload) == event
+
+    def test_missing(self, tmp_path):
+        reader = CatalogSnapshot(str(tmp_path / 'absent.snapshot'))
+        assert not reader.ready
+        assert reader.search(None, None, None, None, 10) is None
+
+    @pytest.mark.asyncio
+    async def test_matches_database(self, tmp_path, monkeypatch):
+        async with AsyncClient(
+            transport=ASGITransport(app=app),
+            base_url="http://test"
+        ) as client:
+
+            params = {'min_price': 0, 'limit': 2}
+
+            async def pages():
+                result = []
+                query = dict(params)
+                while True:
+                    response = await client.get(f"/goods/search", params=query)
+                    assert response.status_code == 200
+                    page = response.json()
+                    if isinstance(page, str):
+                        return result
+                    result += page['items']
+                    if not page['next_cursor']:
+                        return result
+                    query['cursor'] = page['next_cursor']
+
+            expected = await pages()
+
+            async with engine_test.connect() as conn:
+                rows = (await conn.execute(text(GOODS_SQL))).all()
+            builder = SnapshotBuilder()
+            builder.replace(rows)
+            builder.publish(str(tmp_path / 'catalog.snapshot'))
+
+            monkeypatch.setattr(setting, 'CATALOG_SNAPSHOT', True)
+            monkeypatch.setattr(catalog_snapshot, 'path', str(tmp_path / 'catalog.snapshot'))
+
+            assert await pages() == expected
@@ -1,6 +1,12 @@
 import pytest
+import smtplib
+from datetime import date
+from email.message import EmailMessage
+
+from sqlalchemy import text
 
 from tasks.email_msg import (
+                                SmtpPool,
                                 send_email,
                                 after_reg,
                                 verify_account,
@@ -11,6 +17,9 @@ from tasks.email_msg import (
                                 seller_order,
                                 customer_order
                             )
+from tasks.partitions import create_partitions, archive_partitions, \
+                             maintain_partitions
+from database import s_engine
 
 
 def email_values():
@@ -30,8 +39,8 @@ class TestEmail():
 
         send_email(email_body)
 
-        fake_smtp.assert_called_once_with('smtp.gmail.com', 465)
-        smtp_instance = fake_smtp.return_value.__enter__.return_value
+        fake_smtp.assert_called_once_with('smtp.gmail.com', 465, timeout=30)
+        smtp_instance = fake_smtp.return_value
         smtp_instance.login.assert_called_once()
         smtp_instance.send_message.asser_called_once()
         assert smtp_instance.send_message.call_args[0][0]['Subject'] == 'test_subject'
@@ -125,4 +134,138 @@ class TestEmail():
 
         fake_send.assert_called_once()
         assert f'example@mail.com' in fake_send.call_args[0][0]['To']
-        assert f'ex3 (count: 5)' in fake_send.call_args[0][0]['Content']
\ No newline at end of file
+        assert f'ex3 (count: 5)' in fake_send.call_args[0][0]['Content']
+
+class TestSmtpPool():
+
+    def message(self) -> EmailMessage:
+        email = EmailMessage()
+        email['Subject'] = 'test_subject'
+        email.set_content('test_content')
+        return email
+
+    def test_reuses_connection(self, fake_smtp):
+        pool = SmtpPool(size=2, max_messages=100)
+
+        for _ in range(3):
+            pool.send(self.message())
+
+        fake_smtp.assert_called_once()
+        smtp_instance = fake_smtp.return_value
+        smtp_instance.login.assert_called_once()
+        assert smtp_instance.send_message.call_count == 3
+        assert smtp_instance.noop.call_count == 2
+
+    def test_reconnects_after_failed_noop(self, fake_smtp):
+        pool = SmtpPool(size=2, max_messages=100)
+        smtp_instance = fake_smtp.return_value
+
+        pool.send(self.message())
+        smtp_instance.noop.side_effect = smtplib.SMTPServerDisconnected('gone')
+        pool.send(self.message())
+
+        assert fake_smtp.call_count == 2
+        assert smtp_instance.login.call_count == 2
+        assert smtp_instance.send_message.call_count == 2
+
+    def test_reconnects_after_disconnect(self, fake_smtp):
+        pool = SmtpPool(size=2, max_messages=100)
+        smtp_instance = fake_smtp.return_value
+        smtp_instance.send_message.side_effect = [
+            smtplib.SMTPServerDisconnected('gone'), None
+        ]
+
+        pool.send(self.message())
+
+        assert fake_smtp.call_count == 2
+        assert smtp_instance.send_message.call_count == 2
+
+    def test_rotates_after_max_messages(self, fake_smtp):
+        pool = SmtpPool(size=2, max_messages=2)
+
+        for _ in range(5):
+            pool.send(self.message())
+
+        assert fake_smtp.call_count == 3
+        assert fake_smtp.return_value.quit.call_count == 2
+
+    def test_keeps_connection_after_refused_message(self, fake_smtp):
+        pool = SmtpPool(size=2, max_messages=100)
+        smtp_instance = fake_smtp.return_value
+        smtp_instance.send_message.side_effect = [
+            smtplib.SMTPRecipientsRefused({'to_test': (550, b'unknown')}), None
+        ]
+
+        with pytest.raises(smtplib.SMTPRecipientsRefused):
+            pool.send(self.message())
+        pool.send(self.message())
+
+        fake_smtp.assert_called_once()
+
+    def test_reset(self, fake_smtp):
+        pool = SmtpPool(size=2, max_messages=100)
+
+        pool.send(self.message())
+        pool.reset()
+        pool.send(self.message())
+
+        assert fake_smtp.call_count == 2
+        fake_smtp.return_value.quit.assert_not_called()
+
+
+class TestPartitions():
+
+    def test_create_partitions(self):
+        with s_engine.begin() as conn:
+            created = create_partitions(conn, date(2100, 11, 1), 3)
+            assert created == [
+                'order_y2100m11', 'order_y2100m12', 'order_y2101m01',
+                'order_detail_y2100m11', 'order_detail_y2100m12', 'order_detail_y2101m01'
+            ]
+            assert create_partitions(conn, date(2100, 11, 1), 3) == []
+
+    def test_archive_partitions(self):
+        with s_engine.begin() as conn:
+            create_partitions(conn, date(2100, 1, 1), 2)
+            customer_id = conn.execute(
+                text("SELECT id FROM \"user\" WHERE email = 'custver@gmail.com'")
+            ).scalar()
+            good_id = conn.execute(text("SELECT min(id) FROM good")).scalar()
+            order_id = conn.execute(
+                text(
+                    "INSERT INTO \"order\" (customer_id, date_order, ship_country) "
+                    "VALUES (:customer_id, '2100-01-15', 'Moscow') RETURNING id"
+                ),
+                {'customer_id': customer_id}
+            ).scalar()
+            conn.execute(
+                text(
+                    "INSERT INTO order_detail (order_id, good_id, date_order, quantity, price) "
+                    "VALUES (:order_id, :good_id, '2100-01-15', 1, 1)"
+                ),
+                {'order_id': order_id, 'good_id': good_id}
+            )
+
+        try:
+            with s_engine.begin() as conn:
+                archived = archive_partitions(conn, date(2100, 2, 1))
+                assert archived == ['order_detail_y2100m01', 'order_y2100m01']
+
+                assert conn.execute(
+                    text('SELECT count(*) FROM "order" WHERE id = :id'), {'id': order_id}
+                ).scalar() == 0
+                assert conn.execute(
+                    text('SELECT count(*) FROM archive.order_y2100m01')
+                ).scalar() == 1
+                assert conn.execute(
+                    text('SELECT count(*) FROM archive.order_detail_y2100m01')
+                ).scalar() == 1
+        finally:
+            with s_engine.begin() as conn:
+                conn.execute(text('DROP SCHEMA IF EXISTS archive CASCADE'))
+
+    def test_maintain_partitions(self):
+        result = maintain_partitions('2100-03-10')
+        assert 'order_y2100m03' in result['created']
+        assert 'order_detail_y2100m06' in result['created']
+        assert result['archived'] == []